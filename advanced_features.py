@@ -2,6 +2,10 @@
 from __future__ import annotations
 
 import json
+import os
+import sqlite3
+import threading
+import time
 from typing import Any, Dict, List
 
 
@@ -24,21 +28,95 @@ class StrategySelector:
 
 
 class ResultCache:
-    """Simple disk based cache keyed by content hash."""
+    """Disk based cache keyed by content hash.
 
-    def __init__(self, path: str = "cache.json") -> None:
+    Entries live in a SQLite database so each ``set`` is a single-row write
+    and opening the cache does not load its contents. Values must be JSON
+    serialisable. Once more than ``max_entries`` are stored the least recently
+    used ones are evicted. SQLite's locking makes concurrent use from several
+    processes safe. A legacy ``.json`` cache next to the database (such as
+    ``cache.json`` for the default path) is imported into an empty database.
+    """
+
+    _EVICT_EVERY = 100
+
+    def __init__(self, path: str = "cache.sqlite", max_entries: int | None = 10000) -> None:
+        # ``cache.json`` was the old default, so derive the legacy file from
+        # the database path too rather than only from explicit ``.json`` paths
+        stem = os.path.splitext(path)[0]
+        legacy_path = stem + ".json"
+        if path.endswith(".json"):
+            path = stem + ".sqlite"
         self.path = path
-        self.data: Dict[str, Any] = {}
-        try:
-            with open(self.path, "r", encoding="utf-8") as fh:
-                self.data = json.load(fh)
-        except Exception:
-            self.data = {}
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        if os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+
+    def _connection(self) -> sqlite3.Connection:
+        # Reconnect after ``fork`` so processes never share a connection.
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _import_legacy(self, legacy_path: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone():
+                return
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except Exception:
+                return
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO entries (key, value, accessed) VALUES (?, ?, ?)",
+                    ((key, json.dumps(value), now) for key, value in data.items()),
+                )
 
     def get(self, key: str) -> Any:
-        return self.data.get(key)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
 
     def set(self, key: str, value: Any) -> None:
-        self.data[key] = value
-        with open(self.path, "w", encoding="utf-8") as fh:
-            json.dump(self.data, fh)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, accessed) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time()),
+                )
+                self._writes += 1
+                # Eviction scans the index, so amortise it over many writes.
+                if self.max_entries and self._writes % self._EVICT_EVERY == 0:
+                    conn.execute(
+                        "DELETE FROM entries WHERE key IN ("
+                        "SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,259 @@
+"""Columnar store for cross-run analysis of conversation summaries.
+
+Every run is stored as one ``run_<n>.npz`` partition holding one NumPy array
+per column and one row per conversation, so new runs are ingested without
+rewriting earlier ones. Aggregations group rows with ``np.unique`` and reduce
+them with ``np.bincount`` instead of looping over dicts.
+
+Usage::
+
+    python analytics.py ingest
+    python analytics.py report --by prompt_version --last 200
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+import config
+import utils
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - Parquet export optional
+    pyarrow = None
+
+# column name -> (summary key, dtype, missing value)
+COLUMNS = {
+    "run_no": (None, np.int32, -1),
+    "shard": ("shard", np.int32, 0),
+    "pop_agent_id": ("pop_agent_id", np.str_, ""),
+    "name": ("name", np.str_, ""),
+    "personality": ("personality_description", np.str_, ""),
+    "prompt_version": ("prompt_version", np.int32, -1),
+    "success": ("success", np.int8, -1),
+    "score": ("score", np.float64, np.nan),
+    "turns": ("turns", np.int32, -1),
+    "turns_saved": ("turns_saved", np.int32, -1),
+    "stop_reason": ("stop_reason", np.str_, ""),
+    "temperature": ("temperature", np.float64, np.nan),
+    "max_tokens": ("max_tokens", np.int32, -1),
+    "llm_tokens": ("llm_tokens", np.int64, -1),
+    "llm_cost_usd": ("llm_cost_usd", np.float64, np.nan),
+}
+
+_SUMMARY_RE = re.compile(r"^summary_(\d+)\.json$")
+_PARTITION_RE = re.compile(r"^run_(\d+)\.npz$")
+
+
+def _column(entries: Sequence[dict], key: str, dtype, missing) -> np.ndarray:
+    values = []
+    for entry in entries:
+        value = entry.get(key)
+        if value is None:
+            value = missing
+        elif dtype is np.int8:
+            value = int(bool(value))
+        values.append(value)
+    return np.asarray(values, dtype=dtype)
+
+
+def to_columns(run_no: int, entries: Sequence[dict]) -> Dict[str, np.ndarray]:
+    """Convert the summary ``entries`` of ``run_no`` into column arrays."""
+    columns = {}
+    for name, (key, dtype, missing) in COLUMNS.items():
+        if key is None:
+            columns[name] = np.full(len(entries), run_no, dtype=dtype)
+        else:
+            columns[name] = _column(entries, key, dtype, missing)
+    return columns
+
+
+class AnalyticsStore:
+    """Partitioned NumPy column store with one row per conversation."""
+
+    def __init__(self, directory: str | None = None) -> None:
+        self.directory = directory or utils.logs_path(config.ANALYTICS_DIRECTORY)
+        os.makedirs(self.directory, exist_ok=True)
+        self._cache: Dict[int, Dict[str, np.ndarray]] = {}
+
+    def _partition_path(self, run_no: int) -> str:
+        return os.path.join(self.directory, f"run_{run_no}.npz")
+
+    def runs(self) -> List[int]:
+        """Return the ingested run numbers in ascending order."""
+        runs = []
+        for path in glob.glob(os.path.join(self.directory, "run_*.npz")):
+            # skip anything else matching the glob, e.g. a stray temporary file
+            match = _PARTITION_RE.match(os.path.basename(path))
+            if match:
+                runs.append(int(match.group(1)))
+        return sorted(runs)
+
+    def ingest_summary(self, run_no: int, entries: Sequence[dict]) -> int:
+        """Store the summary of ``run_no``, replacing an earlier partition."""
+        columns = to_columns(run_no, entries)
+        path = self._partition_path(run_no)
+        # outside the ``run_*.npz`` pattern, so an interrupted write is never listed
+        tmp_path = os.path.join(self.directory, f".run_{run_no}.tmp.npz")
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, path)
+        self._cache[run_no] = columns
+        return len(entries)
+
+    def ingest(self, logs_dir: str | None = None, refresh: bool = False) -> List[int]:
+        """Ingest every ``summary_<run>.json`` not stored yet.
+
+        With ``refresh`` all summaries are ingested again. Returns the runs
+        that were added.
+        """
+        logs_dir = logs_dir or config.LOGS_DIRECTORY
+        known = set() if refresh else set(self.runs())
+        added = []
+        for name in os.listdir(logs_dir):
+            match = _SUMMARY_RE.match(name)
+            if not match or int(match.group(1)) in known:
+                continue
+            with open(os.path.join(logs_dir, name), "r", encoding="utf-8") as fh:
+                entries = json.load(fh)
+            run_no = int(match.group(1))
+            self.ingest_summary(run_no, entries)
+            added.append(run_no)
+        return sorted(added)
+
+    def load(self, runs: Iterable[int] | None = None, last: int | None = None) -> Dict[str, np.ndarray]:
+        """Return the columns of ``runs`` (or the ``last`` n runs) concatenated."""
+        selected = list(runs) if runs is not None else self.runs()
+        if last is not None:
+            selected = sorted(selected)[-last:]
+        parts = []
+        for run_no in selected:
+            if run_no not in self._cache:
+                with np.load(self._partition_path(run_no)) as data:
+                    self._cache[run_no] = {name: data[name] for name in data.files}
+            parts.append(self._cache[run_no])
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, (_, dtype, _) in COLUMNS.items()}
+        return {
+            name: np.concatenate([
+                # partitions written before a column existed get its missing value
+                part[name] if name in part else np.full(len(part["run_no"]), missing, dtype=dtype)
+                for part in parts
+            ])
+            for name, (_, dtype, missing) in COLUMNS.items()
+        }
+
+    def export_parquet(self, path: str, **load_kwargs) -> None:
+        """Write the selected rows to a Parquet file (requires ``pyarrow``)."""
+        if pyarrow is None:
+            raise ValueError("Parquet export requires the 'pyarrow' package")
+        table = pyarrow.table(self.load(**load_kwargs))
+        pyarrow.parquet.write_table(table, path)
+
+
+def _qualify(by: Sequence[str]) -> List[str]:
+    """Group prompt versions by shard as well; each shard numbers its own versions."""
+    by = list(by)
+    if "prompt_version" in by and "shard" not in by:
+        by.insert(by.index("prompt_version"), "shard")
+    return by
+
+
+def _groups(columns: Dict[str, np.ndarray], by: Sequence[str]) -> tuple[list, np.ndarray]:
+    """Return the distinct ``by`` keys and each row's group index."""
+    if not by:
+        return [()], np.zeros(len(next(iter(columns.values()))), dtype=np.intp)
+    codes = []
+    uniques = []
+    for name in by:
+        values, inverse = np.unique(columns[name], return_inverse=True)
+        uniques.append(values)
+        codes.append(inverse)
+    combined, inverse = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+    keys = [tuple(uniques[i][code].item() for i, code in enumerate(row)) for row in combined]
+    return keys, inverse.reshape(-1)
+
+
+def success_rates(columns: Dict[str, np.ndarray], by: Sequence[str] = ("run_no",)) -> List[dict]:
+    """Return count, success rate and mean score per ``by`` group.
+
+    Rows without a judge result are excluded from the success rate and
+    the mean score. Grouping by ``prompt_version`` also groups by ``shard``.
+    """
+    by = _qualify(by)
+    keys, group = _groups(columns, by)
+    size = len(keys)
+    judged = columns["success"] >= 0
+    scored = ~np.isnan(columns["score"])
+    counts = np.bincount(group, minlength=size)
+    judged_counts = np.bincount(group, weights=judged, minlength=size)
+    successes = np.bincount(group, weights=columns["success"] == 1, minlength=size)
+    scored_counts = np.bincount(group, weights=scored, minlength=size)
+    score_sums = np.bincount(group, weights=np.where(scored, columns["score"], 0.0), minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = successes / judged_counts
+        means = score_sums / scored_counts
+    return [
+        {
+            **dict(zip(by, key)),
+            "conversations": int(counts[i]),
+            "success_rate": None if np.isnan(rates[i]) else round(float(rates[i]), 4),
+            "mean_score": None if np.isnan(means[i]) else round(float(means[i]), 4),
+        }
+        for i, key in enumerate(keys)
+    ]
+
+
+def score_distribution(
+    columns: Dict[str, np.ndarray], by: Sequence[str] = ("prompt_version",), bins: int = 10
+) -> List[dict]:
+    """Return a score histogram over ``[0, 1]`` with ``bins`` buckets per group."""
+    by = _qualify(by)
+    keys, group = _groups(columns, by)
+    scores = columns["score"]
+    scored = ~np.isnan(scores)
+    bucket = np.clip((np.where(scored, scores, 0.0) * bins).astype(np.intp), 0, bins - 1)
+    flat = np.bincount(group[scored] * bins + bucket[scored], minlength=len(keys) * bins)
+    counts = flat.reshape(len(keys), bins)
+    edges = np.linspace(0.0, 1.0, bins + 1).round(4).tolist()
+    return [
+        {**dict(zip(by, key)), "edges": edges, "counts": counts[i].tolist()}
+        for i, key in enumerate(keys)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest run summaries and report aggregates.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="store new summary files")
+    ingest.add_argument("--refresh", action="store_true", help="re-ingest every summary")
+    report = sub.add_parser("report", help="print success rates per group")
+    report.add_argument("--by", nargs="*", default=["run_no"], choices=list(COLUMNS))
+    report.add_argument("--last", type=int, help="only use the last N runs")
+    report.add_argument("--scores", action="store_true", help="print score histograms instead")
+    export = sub.add_parser("export", help="write all rows to a Parquet file")
+    export.add_argument("path")
+    args = parser.parse_args()
+
+    store = AnalyticsStore()
+    if args.command == "ingest":
+        added = store.ingest(refresh=args.refresh)
+        print(f"Ingested {len(added)} runs")
+    elif args.command == "report":
+        columns = store.load(last=args.last)
+        rows = score_distribution(columns, args.by) if args.scores else success_rates(columns, args.by)
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        store.export_parquet(args.path)
+
+
+if __name__ == "__main__":
+    main()
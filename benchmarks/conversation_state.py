@@ -0,0 +1,58 @@
+"""Benchmark message assembly for long conversations.
+
+Compares rebuilding the message list from the transcript on every turn (the
+previous behaviour) with the incremental :class:`ConversationState` views.
+No LLM is called; only the framework's own message handling is timed.
+
+Run from the repository root::
+
+    python -m benchmarks.conversation_state
+"""
+from __future__ import annotations
+
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import config
+from conversation import ConversationState
+
+PROMPT = "You are a persuasive wizard."
+REPLY = "word " * 40
+
+
+def rebuild_each_turn(max_turns: int) -> None:
+    turns = []
+    for _ in range(max_turns):
+        messages = [SystemMessage(content=PROMPT)]
+        for speaker, text in turns:
+            messages.append(HumanMessage(content=text) if speaker == "wizard" else AIMessage(content=text))
+        turns.append(("wizard", REPLY))
+        messages = [SystemMessage(content=PROMPT)]
+        for speaker, text in turns[-config.POP_HISTORY_LIMIT:]:
+            messages.append(HumanMessage(content=text) if speaker == "wizard" else AIMessage(content=text))
+        turns.append(("pop", REPLY))
+
+
+def incremental(max_turns: int) -> None:
+    state = ConversationState({"wizard": None, "pop": config.POP_HISTORY_LIMIT})
+    for _ in range(max_turns):
+        state.messages_for("wizard", PROMPT)
+        state.append("wizard", REPLY)
+        state.messages_for("pop", PROMPT)
+        state.append("pop", REPLY)
+
+
+def main() -> None:
+    print(f"{'max_turns':>10} {'rebuild (ms)':>14} {'incremental (ms)':>18}")
+    for max_turns in (20, 200, 500, 1000):
+        timings = []
+        for fn in (rebuild_each_turn, incremental):
+            start = time.perf_counter()
+            fn(max_turns)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{max_turns:>10} {timings[0]:>14.1f} {timings[1]:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark cold-start import time of the entry point.
+
+Each measurement imports ``integrated_system`` in a fresh interpreter, which
+is also what every worker process of a sharded run pays. The heavy
+dependencies are loaded lazily: ``langchain_openai`` only for the remote
+backend, DSPy only when the wizard first self-improves. The "eager" line
+imports them up front as well, which matches the previous module-level
+imports. The last line is the one-time cost deferred to the first
+improvement.
+
+Run from the repository root::
+
+    python -m benchmarks.import_time [--repeat N]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# (name, untimed setup, timed statement)
+CASES = (
+    ("lazy", "pass", "import integrated_system"),
+    ("eager", "pass", "import integrated_system, langchain_openai, dspy"),
+    ("first improvement", "import integrated_system", "import wizard_improver"),
+)
+
+_TIMED = (
+    "import sys, time; {setup}; start = time.perf_counter(); {code}; "
+    "print(time.perf_counter() - start); "
+    "print(' '.join(m for m in ('dspy', 'langchain_openai', 'httpx') if m in sys.modules))"
+)
+
+
+def measure(setup: str, code: str, repeat: int) -> tuple[float, str]:
+    """Return the median seconds of ``code`` and the heavy modules loaded."""
+    timings, loaded = [], ""
+    for _ in range(repeat):
+        command = [sys.executable, "-c", _TIMED.format(setup=setup, code=code)]
+        out = subprocess.run(command, check=True, capture_output=True, text=True).stdout.splitlines()
+        timings.append(float(out[0]))
+        loaded = out[1] if len(out) > 1 else ""
+    return statistics.median(timings), loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'case':>18} {'median (ms)':>12}  heavy modules loaded")
+    for name, setup, code in CASES:
+        seconds, loaded = measure(setup, code, args.repeat)
+        print(f"{name:>18} {seconds * 1000:>12.0f}  {loaded or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""End-to-end throughput benchmarks on the offline stub backend.
+
+Drives ``IntegratedSystem.run``, ``JudgeAgent.assess`` and
+``train_improver`` with ``config.LLM_BACKEND = "stub"`` so the numbers
+reflect the framework's own overhead plus the configured stub latency.
+Each population size runs in its own subprocess so peak RSS is measured
+independently.
+
+Run from the repository root::
+
+    python -m benchmarks.throughput --sizes 10 100 1000 10000 --latency 0.0
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import config
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentile(values: List[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def configure(args: argparse.Namespace, logs_dir: str) -> None:
+    config.LLM_BACKEND = "stub"
+    config.LOGS_DIRECTORY = logs_dir
+    config.SHOW_LIVE_CONVERSATIONS = False
+    config.SELF_IMPROVE_AFTER = 0
+    config.STUB_LLM_LATENCY_SECONDS = args.latency
+    config.STUB_LLM_REPLY_TOKENS = args.reply_tokens
+    config.MAX_TURNS = args.max_turns
+    config.CONVERSATION_CONCURRENCY = args.concurrency
+    config.GOD_SPAWN_CHUNK_SIZE = args.god_chunk
+
+
+def turn_latencies(logs_dir: str) -> List[float]:
+    """Return the wall time of every wizard/population exchange in the logs."""
+    latencies = []
+    for name in os.listdir(logs_dir):
+        if not name.startswith("Wizard_"):
+            continue
+        with open(os.path.join(logs_dir, name), "r", encoding="utf-8") as fh:
+            log = json.load(fh)
+        previous = datetime.fromisoformat(log["timestamp"])
+        for turn in log["turns"]:
+            if turn["speaker"] != "pop":
+                continue
+            current = datetime.fromisoformat(turn["time"])
+            latencies.append((current - previous).total_seconds())
+            previous = current
+    return latencies
+
+
+def bench_run(size: int, args: argparse.Namespace) -> Dict:
+    from integrated_system import IntegratedSystem
+
+    with tempfile.TemporaryDirectory() as logs_dir:
+        configure(args, logs_dir)
+        system = IntegratedSystem()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            system.run("Generate population", size)
+        elapsed = time.perf_counter() - start
+        latencies = turn_latencies(logs_dir)
+    return {
+        "population": size,
+        "seconds": round(elapsed, 3),
+        "conversations_per_sec": round(size / elapsed, 2),
+        "turns": len(latencies),
+        "p50_turn_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p99_turn_ms": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def synthetic_log(turns: int) -> Dict:
+    return {
+        "goal": config.WIZARD_DEFAULT_GOAL,
+        "prompt": "You are a persuasive wizard.",
+        "turns": [
+            {"speaker": "wizard" if i % 2 == 0 else "pop", "text": "word " * 30}
+            for i in range(turns * 2)
+        ],
+        "judge_result": {"success": False, "score": 0.5},
+    }
+
+
+def bench_judge(args: argparse.Namespace, count: int) -> Dict:
+    from judge_agent import JudgeAgent
+
+    with tempfile.TemporaryDirectory() as logs_dir:
+        configure(args, logs_dir)
+        judge = JudgeAgent()
+        log = synthetic_log(args.max_turns)
+        start = time.perf_counter()
+        for _ in range(count):
+            judge.assess(log)
+        elapsed = time.perf_counter() - start
+    return {"assessments": count, "seconds": round(elapsed, 3), "per_sec": round(count / elapsed, 2)}
+
+
+def bench_improver(args: argparse.Namespace, sizes: List[int]) -> List[Dict]:
+    from wizard_improver import build_dataset, train_improver
+
+    results = []
+    with tempfile.TemporaryDirectory() as logs_dir:
+        configure(args, logs_dir)
+        if build_dataset is None:
+            return results
+        for size in sizes:
+            history = [synthetic_log(args.max_turns) for _ in range(size)]
+            start = time.perf_counter()
+            dataset = build_dataset(history)
+            built = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                _, metrics = train_improver(dataset)
+            done = time.perf_counter()
+            results.append({
+                "dataset": size,
+                "method": metrics.get("method"),
+                "build_dataset_s": round(built - start, 4),
+                "train_s": round(done - built, 3),
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.0, help="stub latency per call in seconds")
+    parser.add_argument("--reply-tokens", type=int, default=30)
+    parser.add_argument("--max-turns", type=int, default=config.MAX_TURNS)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--god-chunk", type=int, default=0)
+    parser.add_argument("--judge-calls", type=int, default=1000)
+    parser.add_argument("--improver-sizes", type=int, nargs="*", default=[1, 3, 30])
+    parser.add_argument("--single-run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_run is not None:
+        print(json.dumps(bench_run(args.single_run, args)))
+        return
+
+    passthrough = [
+        "--latency", str(args.latency), "--reply-tokens", str(args.reply_tokens),
+        "--max-turns", str(args.max_turns), "--concurrency", str(args.concurrency),
+        "--god-chunk", str(args.god_chunk),
+    ]
+    print(f"{'population':>10} {'seconds':>9} {'conv/s':>9} {'turns':>8} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for size in args.sizes:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.throughput", "--single-run", str(size), *passthrough],
+            check=True, capture_output=True, text=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"{r['population']:>10} {r['seconds']:>9} {r['conversations_per_sec']:>9} {r['turns']:>8} "
+            f"{r['p50_turn_ms']:>9} {r['p99_turn_ms']:>9} {r['peak_rss_mb']:>8}"
+        )
+
+    judge = bench_judge(args, args.judge_calls)
+    print(f"\nJudgeAgent.assess: {judge['assessments']} calls in {judge['seconds']}s ({judge['per_sec']}/s)")
+
+    if args.improver_sizes:
+        print("\ntrain_improver:")
+        for r in bench_improver(args, args.improver_sizes):
+            print(f"  dataset={r['dataset']:<4} method={r['method']:<16} "
+                  f"build_dataset={r['build_dataset_s']}s train={r['train_s']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark the memory held by finished conversations.
+
+Simulates the transcript data of a run with many population agents. Each
+agent keeps its last conversation state and the wizard keeps
+``HISTORY_BUFFER_LIMIT`` logs. The legacy layout is compared with the
+compact :mod:`transcript` records, which:
+
+* share one list of ``__slots__`` turns between the agent and the log
+* release the message views once a conversation ends
+
+No LLM is called. Each layout runs in a fresh interpreter so its peak RSS
+can be reported separately.
+
+Run from the repository root::
+
+    python -m benchmarks.transcript_memory [agents]
+"""
+from __future__ import annotations
+
+import resource
+import subprocess
+import sys
+from collections import deque
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import config
+import utils
+from conversation import ConversationState
+from transcript import ConversationLog, register_prompt
+
+GOAL = "Convince the person to buy the product."
+PROMPT = "You are a persuasive wizard. " * 20
+SPEC = {
+    "name": "Agent",
+    "personality_description": "Curious and careful with money.",
+    "system_instruction": "You are Agent. Curious and careful with money. Respond accordingly.",
+    "llm_settings": {"model": config.LLM_MODEL, "temperature": 0.7, "max_tokens": 150},
+}
+
+
+def _reply(agent: int, turn: int, speaker: str) -> str:
+    # distinct strings, as every LLM reply is
+    return f"{speaker} {agent} {turn} " + "word " * 30
+
+
+def legacy(agents: int, turns: int) -> None:
+    states, history = [], deque(maxlen=config.HISTORY_BUFFER_LIMIT)
+    for agent in range(agents):
+        pop_turns = deque(maxlen=config.POP_HISTORY_LIMIT)
+        views = {"pop": deque(maxlen=config.POP_HISTORY_LIMIT), "wizard": deque()}
+        log = {
+            "wizard_id": "Wizard_001",
+            "pop_agent_id": f"pop_{agent}",
+            "pop_agent_spec": dict(SPEC),
+            "goal": GOAL,
+            "prompt": PROMPT,
+            "prompt_version": 0,
+            "turns": [],
+            "timestamp": utils.get_timestamp(),
+        }
+        for turn in range(turns):
+            for speaker in ("wizard", "pop"):
+                text = _reply(agent, turn, speaker)
+                pop_turns.append((speaker, text))
+                for role, view in views.items():
+                    view.append(AIMessage(content=text) if role == speaker else HumanMessage(content=text))
+                log["turns"].append({"speaker": speaker, "text": text, "time": utils.get_timestamp()})
+        states.append((pop_turns, views))
+        history.append(log)
+
+
+def compact(agents: int, turns: int) -> None:
+    register_prompt("Wizard_001", 0, PROMPT)
+    states, history = [], deque(maxlen=config.HISTORY_BUFFER_LIMIT)
+    for agent in range(agents):
+        state = ConversationState({"pop": config.POP_HISTORY_LIMIT, "wizard": None}, config.POP_HISTORY_LIMIT)
+        log = ConversationLog(
+            wizard_id="Wizard_001",
+            pop_agent_id=f"pop_{agent}",
+            pop_agent_spec=SPEC,
+            goal=GOAL,
+            prompt_version=0,
+            turns=state.transcript,
+            timestamp=0.0,
+        )
+        for turn in range(turns):
+            for speaker in ("wizard", "pop"):
+                state.append(speaker, _reply(agent, turn, speaker))
+        state.close()
+        states.append(state)
+        history.append(log)
+
+
+def main() -> None:
+    if len(sys.argv) == 4:
+        layout, agents = sys.argv[2], int(sys.argv[3])
+        {"legacy": legacy, "compact": compact}[layout](agents, config.MAX_TURNS)
+        # ru_maxrss is in kilobytes on Linux
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        return
+    agents = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"{agents} agents, {config.MAX_TURNS} turns each")
+    print(f"{'layout':>10} {'peak RSS (MB)':>14}")
+    for layout in ("legacy", "compact"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.transcript_memory", "--run", layout, str(agents)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        print(f"{layout:>10} {int(out.stdout.split()[-1]) / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,25 @@
 # highest value in ``SELF_IMPROVE_AFTER`` when that setting is a sequence.
 POPULATION_SIZE = 36
 POPULATION_INSTRUCTION_TEMPLATE_PATH = "templates/population_instruction.txt"
+# Number of personas requested per GodAgent call. ``0`` spawns every agent with
+# its own call; a positive value enables the bulk mode which sends chunks of
+# this size in parallel, with at most ``GOD_SPAWN_CONCURRENCY`` calls at once.
+GOD_SPAWN_CHUNK_SIZE = 0
+GOD_SPAWN_CONCURRENCY = 8
+# JSON replies of the God and Judge agents are repaired and validated. When
+# personas or judge fields are still missing the model is asked this many
+# times for just the missing part instead of rerunning the full request.
+STRUCTURED_OUTPUT_MAX_REASKS = 1
 
 # Wizard Settings
 WIZARD_DEFAULT_GOAL = "Convince population to buy"
 WIZARD_PROMPT_TEMPLATE_PATH = "templates/wizard_prompt.txt"
 MAX_TURNS = 20
+# Distinct wizard openers sampled once per prompt version and shared by all
+# conversations, saving the first LLM call of each. ``0`` disables the pool.
+OPENER_POOL_SIZE = 0
+# How conversations take an opener from the pool: "round_robin" or "random"
+OPENER_POOL_SELECTION = "round_robin"
 # Trigger the wizard's self-improvement step. Provide an ``int`` to run the
 # improver every ``n`` conversations or a sequence of ints to trigger on
 # specific conversation counts.  For example::
@@ -18,10 +32,22 @@ MAX_TURNS = 20
 #     SELF_IMPROVE_AFTER = 10           # improve after 10, 20, 30, ...
 # Trigger improvements after conversations 1, 5 and 36 by default.
 SELF_IMPROVE_AFTER = [1, 5, 36]
+# Train the improver on a worker thread while conversations continue on the
+# current prompt. The improved prompt is swapped in once training finishes.
+SELF_IMPROVE_BACKGROUND = False
 SELF_IMPROVE_PROMPT_TEMPLATE_PATH = "templates/self_improve_prompt.txt"
 
 # Judge Settings
 JUDGE_PROMPT_TEMPLATE_PATH = "templates/judge_prompt.txt"
+JUDGE_BATCH_PROMPT_TEMPLATE_PATH = "templates/judge_batch_prompt.txt"
+# Judge finished conversations on background threads instead of inline.
+# Runs only wait for the scores when self-improvement needs them.
+JUDGE_BACKGROUND = False
+# Number of transcripts packed into one judge request in background mode
+JUDGE_BATCH_SIZE = 1
+# Seconds a background batch waits for more transcripts before it is sent
+JUDGE_BATCH_LINGER_SECONDS = 0.5
+JUDGE_QUEUE_WORKERS = 2
 
 # LLM Hyperparameters
 # Default model to use for all LLM calls
@@ -32,13 +58,97 @@ LLM_TEMPERATURE = 0.7
 LLM_MAX_TOKENS = 512
 LLM_TOP_P = 0.9
 
+# LLM Instrumentation
+# Record wall time, queue wait, token usage and estimated cost of every LLM
+# call per role, agent and run. Totals are written to ``metrics_<run>.json``
+# and ``metrics_<run>.prom`` (Prometheus text format) at the end of a run.
+INSTRUMENTATION_ENABLED = True
+# USD per one million tokens; models missing here are reported with cost 0
+LLM_PRICING = {
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+}
+
+# Offline Backend
+# ``"openai"`` uses ChatOpenAI and dspy.LM. ``"stub"`` swaps in the offline
+# models from ``stub_llm`` that return seeded-random replies after a
+# configurable latency, so runs can be profiled without an API key.
+LLM_BACKEND = "openai"
+STUB_LLM_LATENCY_SECONDS = 0.0
+STUB_LLM_PER_TOKEN_LATENCY_SECONDS = 0.0
+STUB_LLM_REPLY_TOKENS = 30
+STUB_LLM_SEED = 0
+# Probability that a stub reply ends with "buy" and so meets the goal
+STUB_LLM_BUY_PROBABILITY = 0.1
+
+# Shared HTTP connection pool used by every chat model client
+LLM_POOL_MAX_CONNECTIONS = 100
+LLM_POOL_MAX_KEEPALIVE = 20
+LLM_POOL_KEEPALIVE_EXPIRY = 30.0
+# Coalesce concurrent ``ainvoke`` calls to the same model (wizard and
+# population turns of conversations run with ``CONVERSATION_CONCURRENCY`` > 1)
+# into one ``abatch`` request. A batch holds at most ``LLM_BATCH_MAX_SIZE``
+# calls (and never more than ``CONVERSATION_CONCURRENCY``) and is sent at the
+# latest ``LLM_BATCH_LINGER_SECONDS`` after its first call.
+LLM_BATCHING_ENABLED = False
+LLM_BATCH_MAX_SIZE = 16
+LLM_BATCH_LINGER_SECONDS = 0.02
+
+# LLM Response Cache
+# Store chat responses on disk keyed by a hash of the model, sampling
+# parameters and messages. Calls with a temperature above zero bypass the
+# cache unless ``LLM_CACHE_REPLAY`` is enabled, in which case the n-th
+# identical sampled call replays the n-th recorded response. A relative
+# ``LLM_CACHE_PATH`` is resolved under ``LOGS_DIRECTORY``.
+LLM_CACHE_ENABLED = False
+LLM_CACHE_REPLAY = False
+LLM_CACHE_PATH = "llm_cache.sqlite"
+LLM_CACHE_MAX_ENTRIES = 100000
+# Entries older than this many seconds are discarded (``None`` keeps them)
+LLM_CACHE_TTL_SECONDS = None
+
 # File/Logging Settings
 LOGS_DIRECTORY = "logs"
 JSON_INDENT = 2
+# Write conversation, persona spec and improvement logs through a background
+# writer that appends them to rotating JSONL segments instead of one file per
+# log. ``python log_sink.py`` exports the segments back to the per-file layout.
+# A relative ``LOG_SINK_DIRECTORY`` is resolved under ``LOGS_DIRECTORY``.
+LOG_SINK_ENABLED = False
+LOG_SINK_DIRECTORY = "segments"
+LOG_SINK_SEGMENT_MAX_RECORDS = 10000
+LOG_SINK_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# ``None``, ``"gzip"`` or ``"zstd"`` (requires the ``zstandard`` package)
+LOG_SINK_COMPRESSION = None
+# Add every run summary to the columnar store in ``ANALYTICS_DIRECTORY``
+# (see ``analytics.py``) when the run finishes. A relative
+# ``ANALYTICS_DIRECTORY`` is resolved under ``LOGS_DIRECTORY``.
+ANALYTICS_ENABLED = False
+ANALYTICS_DIRECTORY = "analytics"
 
 # Runtime Options
 # Set to True to print conversation turns to the terminal while running
 SHOW_LIVE_CONVERSATIONS = True
+# Stream wizard and population replies. Population replies are checked for
+# the goal while streaming and generation stops as soon as it is detected.
+STREAM_RESPONSES = False
+# Number of conversations run at the same time. ``1`` keeps the serial loop;
+# larger values run conversations concurrently on asyncio using the
+# ``ainvoke`` paths of the wizard, population and judge LLMs.
+CONVERSATION_CONCURRENCY = 1
+# Number of worker processes a run is split across (``main.py --shards``).
+# Each shard runs its part of the population with its own wizard, and the
+# summaries, metrics and structured logs are merged when all shards finish.
+# Each shard applies ``SELF_IMPROVE_AFTER`` to its own conversations and
+# numbers its own prompt versions; summary entries record their ``shard``.
+RUN_SHARDS = 1
+# Write ``logs/checkpoint_<run>.json`` after every this many completed
+# conversations so ``main.py --resume <run>`` can continue an interrupted
+# run. ``0`` disables checkpoints.
+CHECKPOINT_EVERY = 5
 
 # Dspy Settings
 DSPY_TRAINING_ITER = 1
@@ -46,11 +156,49 @@ DSPY_LEARNING_RATE = 0.01
 # Optimizer thresholds
 DSPY_BOOTSRAP_MINIBATCH_SIZE = 3
 DSPY_MIPRO_MINIBATCH_SIZE = 30
+# Threads used by MIPROv2 and COPRO to evaluate candidate prompts
+DSPY_NUM_THREADS = 1
+# Hard limits for one improvement step. Once either is reached the optimizer
+# stops and the best candidate evaluated so far is used. ``None`` = no limit.
+DSPY_MAX_LM_CALLS = None
+DSPY_MAX_SECONDS = None
+# Save compiled improver programs under ``IMPROVER_CACHE_DIRECTORY`` keyed by
+# a hash of the dataset and optimizer settings; an identical dataset reuses
+# the stored program instead of recompiling.
+IMPROVER_CACHE_ENABLED = False
+# Start each optimization from the last trained program (its instructions
+# and demos) instead of a fresh ``WizardImprover``.
+IMPROVER_WARM_START = False
+# A relative ``IMPROVER_CACHE_DIRECTORY`` is resolved under ``LOGS_DIRECTORY``.
+IMPROVER_CACHE_DIRECTORY = "improver_cache"
 # Maximum number of conversation logs kept in memory for self improvement
 HISTORY_BUFFER_LIMIT = 50
 # Maximum conversation history stored by each population agent
 POP_HISTORY_LIMIT = 50
 
+# Context Compaction
+# Token budget for every prompt sent by the wizard and population agents.
+# ``None`` disables compaction. When a prompt would exceed the budget, all but
+# the last ``CONTEXT_KEEP_TURNS`` messages are folded into a rolling summary.
+CONTEXT_TOKEN_BUDGET = None
+CONTEXT_KEEP_TURNS = 6
+CONTEXT_SUMMARY_MAX_TOKENS = 256
+CONTEXT_SUMMARY_TEMPLATE_PATH = "templates/context_summary_prompt.txt"
+
+# Stop Detection
+# Classifier scoring each population reply for accept, refuse and stall (see
+# ``stop_detector.py``): ``"keyword"`` only accepts on "buy", ``"regex"`` uses
+# compiled phrase lists and ``"ngram"`` word n-grams scored with NumPy.
+STOP_DETECTOR = "keyword"
+# A conversation ends on the first reply whose accept score reaches
+# ``STOP_ACCEPT_THRESHOLD``, or after ``STOP_REFUSE_TURNS`` (``STOP_STALL_TURNS``)
+# consecutive replies reaching the refuse (stall) threshold.
+STOP_ACCEPT_THRESHOLD = 0.5
+STOP_REFUSE_THRESHOLD = 0.5
+STOP_REFUSE_TURNS = 2
+STOP_STALL_THRESHOLD = 0.9
+STOP_STALL_TURNS = 3
+
 # Miscellaneous
 DEFAULT_TIMEZONE = "UTC"
 
@@ -0,0 +1,143 @@
+"""Token-budgeted context compaction for long conversations."""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import List, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+import config
+import llm_clients
+import prompts
+from conversation import ConversationState
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # pragma: no cover - tiktoken optional
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Return the number of tokens in ``text`` (approximate without tiktoken)."""
+    enc = _encoding()
+    if enc is None:
+        return max(len(text) // 4, 1)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+class ContextManager:
+    """Keep prompts under a token budget by folding old turns into a summary.
+
+    The system prompt and the last ``keep_turns`` messages are always sent
+    verbatim. When the prompt would exceed ``token_budget`` the older
+    messages are removed from the role's view and folded into a rolling
+    summary stored on the :class:`ConversationState`. Only the newly folded
+    messages are sent to the summarizer together with the previous summary,
+    so the summary is updated incrementally rather than rebuilt.
+    """
+
+    def __init__(
+        self,
+        token_budget: int | None = None,
+        keep_turns: int | None = None,
+        llm_settings: dict | None = None,
+    ) -> None:
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.keep_turns = keep_turns if keep_turns is not None else config.CONTEXT_KEEP_TURNS
+        self.llm_settings = llm_settings or {
+            "model": config.LLM_MODEL,
+            "temperature": 0.0,
+            "max_tokens": config.CONTEXT_SUMMARY_MAX_TOKENS,
+        }
+        self.llm = llm_clients.get_chat_model(self.llm_settings)
+        self.template = prompts.load(config.CONTEXT_SUMMARY_TEMPLATE_PATH)
+
+    @staticmethod
+    def _visible_tokens(state: ConversationState, role: str) -> int:
+        counts = list(state.token_counts(role))
+        view_len = len(state.view(role))
+        return sum(counts[len(counts) - view_len:]) if view_len else 0
+
+    @staticmethod
+    def _count_system(state: ConversationState, role: str, system_prompt: str) -> None:
+        # the prompt is pinned for the conversation, so it is tokenized once
+        if role not in state.system_tokens:
+            state.system_tokens[role] = count_tokens(system_prompt)
+
+    def _fold(self, state: ConversationState, role: str) -> List[BaseMessage] | None:
+        view = state.view(role)
+        summary = state.summaries.get(role)
+        total = state.system_tokens[role] + self._visible_tokens(state, role)
+        if summary:
+            total += count_tokens(SUMMARY_PREFIX + summary)
+        if total <= self.token_budget or len(view) <= self.keep_turns:
+            return None
+        return [view.popleft() for _ in range(len(view) - self.keep_turns)]
+
+    def _summary_messages(self, role: str, summary: str, folded: List[BaseMessage]) -> list:
+        other = "pop" if role == "wizard" else "wizard"
+        turns = "\n".join(
+            f"{role if isinstance(msg, AIMessage) else other}: {msg.content}" for msg in folded
+        )
+        variables = {"summary": summary or "(none)", "turns": turns}
+        prompt = self.template.render(variables)
+        request = "Return the updated summary only."
+        if "turns" not in self.template.variables:
+            # the summary and turns change on every call, so they follow the
+            # shared instructions in the human message
+            request = f"Current summary:\n{variables['summary']}\nNew turns to fold in:\n{turns}\n{request}"
+        return [SystemMessage(content=prompt), HumanMessage(content=request)]
+
+    def _assemble(self, state: ConversationState, role: str, system_prompt: str) -> Tuple[list, dict]:
+        messages: List[BaseMessage] = [SystemMessage(content=system_prompt)]
+        sent = state.system_tokens[role] + self._visible_tokens(state, role)
+        summary = state.summaries.get(role)
+        if summary:
+            messages.append(SystemMessage(content=SUMMARY_PREFIX + summary))
+            sent += count_tokens(SUMMARY_PREFIX + summary)
+        messages.extend(state.view(role))
+        usage = {
+            "prompt_tokens": sent,
+            "uncompacted_tokens": state.system_tokens[role] + sum(state.token_counts(role)),
+        }
+        return messages, usage
+
+    def prepare(self, state: ConversationState, role: str, system_prompt: str) -> Tuple[list, dict]:
+        """Return ``(messages, usage)`` for ``role``, compacting if needed."""
+        self._count_system(state, role, system_prompt)
+        folded = self._fold(state, role)
+        if folded:
+            summary = state.summaries.get(role, "")
+            reply = self.llm.invoke(self._summary_messages(role, summary, folded))
+            state.summaries[role] = reply.content.strip()
+        return self._assemble(state, role, system_prompt)
+
+    async def aprepare(self, state: ConversationState, role: str, system_prompt: str) -> Tuple[list, dict]:
+        """Async variant of :meth:`prepare` using ``ainvoke``."""
+        self._count_system(state, role, system_prompt)
+        folded = self._fold(state, role)
+        if folded:
+            summary = state.summaries.get(role, "")
+            reply = await self.llm.ainvoke(self._summary_messages(role, summary, folded))
+            state.summaries[role] = reply.content.strip()
+        return self._assemble(state, role, system_prompt)
+
+
+_shared: ContextManager | None = None
+
+
+def get_context_manager() -> ContextManager | None:
+    """Return the shared manager, or ``None`` when compaction is disabled."""
+    global _shared
+    if not config.CONTEXT_TOKEN_BUDGET:
+        return None
+    if _shared is None:
+        _shared = ContextManager()
+    return _shared
@@ -0,0 +1,95 @@
+"""Incrementally built conversation state shared by wizard and population."""
+from __future__ import annotations
+
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Dict, List, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from transcript import Turn
+
+
+class ConversationState:
+    """Transcript that keeps one ready-made message view per participant.
+
+    ``windows`` maps each role (``"wizard"``/``"pop"``) to the maximum number
+    of messages it sees, or ``None`` for the full transcript. Appending a turn
+    builds its message objects once and pushes them onto each role's bounded
+    deque, so a view never has to be rebuilt from the transcript. Each view
+    is role-flipped: the role's own turns are ``AIMessage`` and the other
+    side's turns are ``HumanMessage``.
+
+    When ``token_counter`` is given, the token count of every message is kept
+    per role so a :class:`context_manager.ContextManager` can compact views
+    that exceed its budget. ``summaries`` holds each role's rolling summary.
+
+    ``transcript`` keeps every :class:`transcript.Turn` of the conversation;
+    the wizard's log shares this list. ``turns`` holds the last
+    ``turn_limit`` of the same records.
+    """
+
+    def __init__(
+        self,
+        windows: Dict[str, int | None],
+        turn_limit: int | None = None,
+        token_counter: Callable[[str], int] | None = None,
+    ) -> None:
+        self._views: Dict[str, Deque[BaseMessage]] = {
+            role: deque(maxlen=limit) for role, limit in windows.items()
+        }
+        self._token_counts: Dict[str, Deque[int]] = {
+            role: deque(maxlen=limit) for role, limit in windows.items()
+        }
+        self._token_counter = token_counter
+        self.transcript: List[Turn] = []
+        self.turns: Deque[Turn] = deque(maxlen=turn_limit)
+        self.summaries: Dict[str, str] = {}
+        self.system_tokens: Dict[str, int] = {}
+
+    def append(self, speaker: str, text: str) -> Turn:
+        turn = Turn(speaker, text)
+        self.transcript.append(turn)
+        self.turns.append(turn)
+        if self._token_counter is not None:
+            tokens = self._token_counter(text)
+            for counts in self._token_counts.values():
+                counts.append(tokens)
+        own = other = None
+        for role, view in self._views.items():
+            if role == speaker:
+                own = own or AIMessage(content=text)
+                view.append(own)
+            else:
+                other = other or HumanMessage(content=text)
+                view.append(other)
+        return turn
+
+    def view(self, role: str) -> Deque[BaseMessage]:
+        """Return the live message deque for ``role`` (not a copy)."""
+        return self._views[role]
+
+    def token_counts(self, role: str) -> Deque[int]:
+        """Return token counts of the last messages in ``role``'s window."""
+        return self._token_counts[role]
+
+    def messages_for(self, role: str, system_prompt: str) -> List[BaseMessage]:
+        """Return the message list to send on behalf of ``role``."""
+        return [SystemMessage(content=system_prompt), *self._views[role]]
+
+    def last_turns(self, n: int) -> List[Tuple[str, str]]:
+        """Return the last ``n`` ``(speaker, text)`` turns."""
+        start = max(len(self.turns) - n, 0)
+        return [(turn.speaker, turn.text) for turn in islice(self.turns, start, None)]
+
+    def close(self) -> None:
+        """Drop the message views once the conversation is over.
+
+        Only the transcript is kept, so finished conversations do not hold
+        a second copy of every message.
+        """
+        for view in self._views.values():
+            view.clear()
+        for counts in self._token_counts.values():
+            counts.clear()
+        self.summaries.clear()
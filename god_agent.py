@@ -1,14 +1,18 @@
 """GodAgent spawns population agents."""
 from __future__ import annotations
 
-import json
-from typing import List
+import asyncio
+import time
+from typing import Callable, List, Sequence
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
 
 import config
+import instrumentation
+import llm_clients
+import prompts
+import structured_output
 import utils
 from population_agent import PopulationAgent
 
@@ -20,12 +24,47 @@ class GodAgent:
             "temperature": config.LLM_TEMPERATURE,
             "max_tokens": config.LLM_MAX_TOKENS,
         }
-        self.llm = ChatOpenAI(
-            model=self.llm_settings["model"],
-            temperature=self.llm_settings["temperature"],
-            max_tokens=self.llm_settings["max_tokens"],
+        self.llm = llm_clients.get_chat_model(self.llm_settings)
+        self.template = prompts.load(config.POPULATION_INSTRUCTION_TEMPLATE_PATH)
+
+    def _build_messages(self, instruction_text: str, n: int) -> list:
+        # the count and instruction go last so every call shares the system prompt
+        prompt = self.template.render({"instruction": instruction_text, "n": n})
+        request = f"Create {n} individuals. Instruction: {instruction_text}.\nProvide the JSON array only."
+        return [SystemMessage(content=prompt), HumanMessage(content=request)]
+
+    def _build_chunk_messages(self, instructions: List[str]) -> list:
+        """Build the request for one bulk chunk, one instruction per persona."""
+        if len(set(instructions)) == 1:
+            return self._build_messages(instructions[0], len(instructions))
+        numbered = "\n".join(f"{i}. {text}" for i, text in enumerate(instructions, start=1))
+        prompt = self.template.render({"instruction": "", "n": len(instructions)})
+        request = (
+            f"Create {len(instructions)} individuals, one per numbered instruction, in the same order:\n"
+            f"{numbered}\nProvide the JSON array only."
+        )
+        return [SystemMessage(content=prompt), HumanMessage(content=request)]
+
+    def _stream_personas(self, messages: list, on_persona: Callable[[dict], None]) -> str:
+        """Stream the reply, passing every persona to ``on_persona`` once it is complete."""
+        parser = structured_output.JsonArrayStream(structured_output.PERSONA_SCHEMA)
+        parts = []
+        for chunk in self.llm.stream(messages):
+            parts.append(chunk.content)
+            for spec in parser.feed(chunk.content):
+                on_persona(spec)
+        for spec in parser.close():
+            on_persona(spec)
+        return "".join(parts)
+
+    def _make_agent(self, spec: dict, run_no: int, idx: int) -> PopulationAgent:
+        return PopulationAgent(
+            agent_id=utils.format_agent_id(run_no, idx),
+
+            name=spec.get("name"),
+            personality_description=spec.get("personality"),
+            llm_settings=self.llm_settings,
         )
-        self.template = utils.load_template(config.POPULATION_INSTRUCTION_TEMPLATE_PATH)
 
     def spawn_population(
         self,
@@ -36,24 +75,15 @@ class GodAgent:
     ) -> List[PopulationAgent]:
 
         n = n or config.POPULATION_SIZE
-        prompt = utils.render_template(self.template, {"instruction": instruction_text, "n": n})
-        messages = [SystemMessage(content=prompt), HumanMessage(content="Provide the JSON array only.")]
-        response = self.llm.invoke(messages).content
-        try:
-            personas = json.loads(response)
-        except json.JSONDecodeError:
-            personas = utils.extract_json_array(response)
-            if personas is None:
-                raise
+        messages = self._build_messages(instruction_text, n)
         population = []
-        for idx, spec in enumerate(personas, start=start_index):
-            agent = PopulationAgent(
-                agent_id=utils.format_agent_id(run_no, idx),
+        personas = []
 
-                name=spec.get("name"),
-                personality_description=spec.get("personality"),
-                llm_settings=self.llm_settings,
-            )
+        def _add(spec: dict) -> None:
+            if len(personas) >= n:
+                return
+            personas.append(spec)
+            agent = self._make_agent(spec, run_no, start_index + len(population))
             population.append(agent)
 
             # Save the agent specification immediately so users can inspect it
@@ -61,4 +91,84 @@ class GodAgent:
             utils.save_conversation_log(agent.get_spec(), log_filename)
             print(f"Created {agent.agent_id} -> {log_filename}")
 
+        with instrumentation.scope("god", "god"):
+            if config.STREAM_RESPONSES:
+                # agents are created while the rest of the reply streams in
+                response = self._stream_personas(messages, _add)
+            else:
+                response = self.llm.invoke(messages).content
+                for spec in structured_output.parse_array(response, structured_output.PERSONA_SCHEMA)[0]:
+                    _add(spec)
+            # only the personas still missing are requested again
+            for spec in structured_output.complete_array(
+                self.llm, messages, response, personas, structured_output.PERSONA_SCHEMA, n
+            ):
+                _add(spec)
+        if not population:
+            raise structured_output.StructuredOutputError("no valid personas in the God agent's reply")
+        return population
+
+    def spawn_population_bulk(
+        self,
+        instructions: Sequence[str],
+        run_no: int = 0,
+        start_index: int = 1,
+        chunk_size: int | None = None,
+    ) -> List[PopulationAgent]:
+        """Spawn one agent per entry of ``instructions`` using chunked calls.
+
+        The instructions are split into chunks of ``chunk_size`` personas and
+        every chunk is requested in its own LLM call, with up to
+        ``config.GOD_SPAWN_CONCURRENCY`` calls in flight at once. Agent
+        indices depend only on the position in ``instructions`` so they are
+        stable regardless of the order in which chunks complete. Distinct
+        instructions within a chunk are sent as a numbered list and the
+        personas are matched to them by position. If a reply still holds
+        fewer personas than requested after the re-asks, the missing indices
+        are skipped and a warning reports the shortfall. All specs are
+        written to one combined file once spawning finishes.
+        """
+        chunk_size = chunk_size or config.GOD_SPAWN_CHUNK_SIZE or len(instructions)
+        chunks = [
+            (offset, list(instructions[offset:offset + chunk_size]))
+            for offset in range(0, len(instructions), chunk_size)
+        ]
+        results = utils.run_async(self._aspawn_chunks(chunks))
+
+        population: List[PopulationAgent] = []
+        for (offset, chunk), personas in zip(chunks, results):
+            for pos, spec in enumerate(personas[:len(chunk)]):
+                population.append(self._make_agent(spec, run_no, start_index + offset + pos))
+        if len(population) < len(instructions):
+            missing = [
+                start_index + offset + pos
+                for (offset, chunk), personas in zip(chunks, results)
+                for pos in range(len(personas), len(chunk))
+            ]
+            print(
+                f"Warning: the God agent returned {len(population)} of {len(instructions)} "
+                f"personas; agents {missing} of run {run_no} were not created."
+            )
+
+        # one combined file keyed by agent id instead of a file per agent
+        stamp = utils.get_timestamp().replace(':', '').replace('-', '')
+        log_filename = f"population_{run_no}_spec_{stamp}.json"
+        utils.save_conversation_log({agent.agent_id: agent.get_spec() for agent in population}, log_filename)
+        print(f"Created {len(population)} agents in {len(chunks)} batches -> {log_filename}")
         return population
+
+    async def _aspawn_chunks(self, chunks: List[tuple]) -> List[list]:
+        semaphore = asyncio.Semaphore(config.GOD_SPAWN_CONCURRENCY)
+
+        async def _spawn(chunk: List[str]) -> list:
+            messages = self._build_chunk_messages([str(text) for text in chunk])
+            with instrumentation.scope("god", "god", queued_at=time.perf_counter()):
+                async with semaphore:
+                    response = (await self.llm.ainvoke(messages)).content
+                    personas = structured_output.parse_array(response, structured_output.PERSONA_SCHEMA)[0]
+                    personas += await structured_output.acomplete_array(
+                        self.llm, messages, response, personas, structured_output.PERSONA_SCHEMA, len(chunk)
+                    )
+            return personas
+
+        return await asyncio.gather(*(_spawn(chunk) for _, chunk in chunks))
@@ -0,0 +1,372 @@
+"""Per-call latency, token and cost instrumentation for LLM invocations."""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Sequence
+
+import config
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (64, 256, 1024, 4096, 16384, 65536)
+
+_scope: contextvars.ContextVar[Dict[str, Any] | None] = contextvars.ContextVar("llm_scope", default=None)
+
+
+@contextlib.contextmanager
+def scope(role: str, agent: str | None = None, conversation: str | None = None,
+          queued_at: float | None = None) -> Iterator[None]:
+    """Attribute LLM calls made inside the block to ``role``/``agent``.
+
+    ``queued_at`` (a ``time.perf_counter`` value) marks when the work was
+    queued; the first call in the block, or in a nested scope, reports the
+    time since then as its queue wait.
+    """
+    parent = _scope.get()
+    if queued_at is None and parent is not None:
+        queued = parent["queued"]
+    else:
+        queued = [queued_at]
+    token = _scope.set({"role": role, "agent": agent, "conversation": conversation, "queued": queued})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _current_scope() -> Dict[str, Any]:
+    return _scope.get() or {"role": "other", "agent": None, "conversation": None, "queued": [None]}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[tuple]:
+        running = 0
+        out = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            out.append((bound, running))
+        return out
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Add the counts of a histogram exported with :meth:`to_dict`."""
+        previous = 0
+        for i, cumulative in enumerate(data["buckets"].values()):
+            self.counts[i] += cumulative - previous
+            previous = cumulative
+        self.total += data["sum"]
+        self.count += data["count"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "buckets": {str(bound): n for bound, n in self.cumulative()},
+        }
+
+
+def _new_totals() -> Dict[str, float]:
+    return {
+        "calls": 0,
+        "wall_s": 0.0,
+        "queue_wait_s": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "cost_usd": 0.0,
+    }
+
+
+def _cache_split(totals: Dict[str, float]) -> Dict[str, float]:
+    prompt, cached = totals["prompt_tokens"], totals["cached_tokens"]
+    return {
+        "cached_tokens": cached,
+        "uncached_tokens": max(prompt - cached, 0),
+        "cached_ratio": round(cached / prompt, 4) if prompt else 0.0,
+    }
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    """Return the estimated USD cost using ``config.LLM_PRICING`` (per 1M tokens)."""
+    prices = config.LLM_PRICING.get(model)
+    if not prices:
+        return 0.0
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    cached_price = prices.get("cached_input", prices.get("input", 0.0))
+    return (
+        uncached * prices.get("input", 0.0)
+        + cached_tokens * cached_price
+        + completion_tokens * prices.get("output", 0.0)
+    ) / 1_000_000
+
+
+class Instrumentation:
+    """Aggregate per-call measurements by role, agent and conversation."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, run_no: int | None = None) -> None:
+        with self._lock:
+            self.run_no = run_no
+            self.by_role: Dict[str, Dict[str, float]] = defaultdict(_new_totals)
+            self.by_agent: Dict[str, Dict[str, float]] = defaultdict(_new_totals)
+            self.by_conversation: Dict[str, Dict[str, float]] = defaultdict(_new_totals)
+            self.latency: Dict[str, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+            self.queue_wait: Dict[str, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+            self.prompt_size: Dict[str, Histogram] = defaultdict(lambda: Histogram(TOKEN_BUCKETS))
+
+    def record(
+        self,
+        model: str,
+        wall: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        queue_wait: float = 0.0,
+        role: str | None = None,
+        agent: str | None = None,
+        conversation: str | None = None,
+    ) -> None:
+        ctx = _current_scope()
+        role = role or ctx["role"]
+        agent = agent or ctx["agent"]
+        conversation = conversation or ctx["conversation"]
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        with self._lock:
+            targets = [self.by_role[role]]
+            if agent:
+                targets.append(self.by_agent[agent])
+            if conversation:
+                targets.append(self.by_conversation[conversation])
+            for totals in targets:
+                totals["calls"] += 1
+                totals["wall_s"] += wall
+                totals["queue_wait_s"] += queue_wait
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cached_tokens"] += cached_tokens
+                totals["cost_usd"] += cost
+            self.latency[role].observe(wall)
+            self.queue_wait[role].observe(queue_wait)
+            self.prompt_size[role].observe(prompt_tokens)
+
+    def conversation_totals(self, conversation: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.by_conversation.get(conversation) or _new_totals())
+
+    def prompt_cache(self) -> Dict[str, Dict[str, float]]:
+        """Return cached and uncached prompt tokens per role."""
+        with self._lock:
+            return {role: _cache_split(totals) for role, totals in self.by_role.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all aggregates as a JSON-serialisable dict."""
+        prompt_cache = self.prompt_cache()
+        with self._lock:
+            return {
+                "run_no": self.run_no,
+                "by_role": {k: dict(v) for k, v in self.by_role.items()},
+                "prompt_cache": prompt_cache,
+                "by_agent": {k: dict(v) for k, v in self.by_agent.items()},
+                "latency_s": {k: h.to_dict() for k, h in self.latency.items()},
+                "queue_wait_s": {k: h.to_dict() for k, h in self.queue_wait.items()},
+                "prompt_tokens": {k: h.to_dict() for k, h in self.prompt_size.items()},
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Add the totals and histograms of another process's :meth:`snapshot`."""
+        with self._lock:
+            for source, target in ((snapshot["by_role"], self.by_role), (snapshot["by_agent"], self.by_agent)):
+                for name, totals in source.items():
+                    for key, value in totals.items():
+                        target[name][key] += value
+            for key, hists in (
+                ("latency_s", self.latency),
+                ("queue_wait_s", self.queue_wait),
+                ("prompt_tokens", self.prompt_size),
+            ):
+                for role, data in snapshot[key].items():
+                    hists[role].merge(data)
+
+    def to_prometheus(self) -> str:
+        """Return the aggregates in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            counters = [
+                ("llm_calls_total", "calls"),
+                ("llm_prompt_tokens_total", "prompt_tokens"),
+                ("llm_completion_tokens_total", "completion_tokens"),
+                ("llm_cached_tokens_total", "cached_tokens"),
+                ("llm_cost_usd_total", "cost_usd"),
+            ]
+            for name, key in counters:
+                lines.append(f"# TYPE {name} counter")
+                for role, totals in sorted(self.by_role.items()):
+                    lines.append(f'{name}{{role="{role}"}} {totals[key]}')
+            lines.append("# TYPE llm_uncached_prompt_tokens_total counter")
+            for role, totals in sorted(self.by_role.items()):
+                lines.append(f'llm_uncached_prompt_tokens_total{{role="{role}"}} {_cache_split(totals)["uncached_tokens"]}')
+            for name, hists in (
+                ("llm_call_seconds", self.latency),
+                ("llm_queue_wait_seconds", self.queue_wait),
+                ("llm_prompt_tokens", self.prompt_size),
+            ):
+                lines.append(f"# TYPE {name} histogram")
+                for role, hist in sorted(hists.items()):
+                    for bound, count in hist.cumulative():
+                        lines.append(f'{name}_bucket{{role="{role}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{role="{role}"}} {hist.total}')
+                    lines.append(f'{name}_count{{role="{role}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    """Return the process-wide :class:`Instrumentation`."""
+    return _instrumentation
+
+
+def _usage(message: Any) -> tuple[int, int, int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return (
+        usage.get("input_tokens", 0) or 0,
+        usage.get("output_tokens", 0) or 0,
+        details.get("cache_read", 0) or 0,
+    )
+
+
+def _take_queue_wait(start: float) -> float:
+    ctx = _scope.get()
+    if ctx is None or ctx["queued"][0] is None:
+        return 0.0
+    wait = max(start - ctx["queued"][0], 0.0)
+    ctx["queued"][0] = None
+    return wait
+
+
+class InstrumentedChatModel:
+    """Wrap a chat model and record every call in :class:`Instrumentation`."""
+
+    def __init__(self, llm: Any, model: str, instrumentation: Instrumentation | None = None) -> None:
+        self.llm = llm
+        self.model = model
+        self.instrumentation = instrumentation or get_instrumentation()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _record(self, start: float, message: Any, queue_wait: float) -> None:
+        prompt, completion, cached = _usage(message)
+        self.instrumentation.record(
+            self.model, time.perf_counter() - start, prompt, completion, cached, queue_wait
+        )
+
+    def invoke(self, messages: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        wait = _take_queue_wait(start)
+        response = self.llm.invoke(messages, **kwargs)
+        self._record(start, response, wait)
+        return response
+
+    async def ainvoke(self, messages: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        wait = _take_queue_wait(start)
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self._record(start, response, wait)
+        return response
+
+    def batch(self, inputs: List[Any], **kwargs: Any) -> List[Any]:
+        start = time.perf_counter()
+        wait = _take_queue_wait(start)
+        responses = self.llm.batch(inputs, **kwargs)
+        for response in responses:
+            self._record(start, response, wait)
+        return responses
+
+    async def abatch(self, inputs: List[Any], **kwargs: Any) -> List[Any]:
+        start = time.perf_counter()
+        wait = _take_queue_wait(start)
+        responses = await self.llm.abatch(inputs, **kwargs)
+        for response in responses:
+            self._record(start, response, wait)
+        return responses
+
+    def stream(self, messages: Any, **kwargs: Any) -> Iterator[Any]:
+        start = time.perf_counter()
+        wait = _take_queue_wait(start)
+        totals = [0, 0, 0]
+        try:
+            for chunk in self.llm.stream(messages, **kwargs):
+                totals = [a + b for a, b in zip(totals, _usage(chunk))]
+                yield chunk
+        finally:
+            self.instrumentation.record(self.model, time.perf_counter() - start, *totals, queue_wait=wait)
+
+    async def astream(self, messages: Any, **kwargs: Any):
+        start = time.perf_counter()
+        wait = _take_queue_wait(start)
+        totals = [0, 0, 0]
+        try:
+            async for chunk in self.llm.astream(messages, **kwargs):
+                totals = [a + b for a, b in zip(totals, _usage(chunk))]
+                yield chunk
+        finally:
+            self.instrumentation.record(self.model, time.perf_counter() - start, *totals, queue_wait=wait)
+
+
+def dspy_callback():
+    """Return a DSPy callback recording optimizer LM calls as role ``optimizer``."""
+    from dspy.utils.callback import BaseCallback
+
+    instrumentation = get_instrumentation()
+
+    class _LMCallback(BaseCallback):
+        def __init__(self) -> None:
+            self._calls: Dict[str, tuple] = {}
+
+        def on_lm_start(self, call_id, instance, inputs):
+            self._calls[call_id] = (time.perf_counter(), instance, len(getattr(instance, "history", [])))
+
+        def on_lm_end(self, call_id, outputs, exception=None):
+            start, instance, seen = self._calls.pop(call_id, (None, None, 0))
+            if start is None:
+                return
+            history = getattr(instance, "history", [])
+            usage = history[-1].get("usage", {}) if len(history) > seen else {}
+            details = usage.get("prompt_tokens_details") or {}
+            instrumentation.record(
+                getattr(instance, "model", "unknown"),
+                time.perf_counter() - start,
+                usage.get("prompt_tokens", 0) or 0,
+                usage.get("completion_tokens", 0) or 0,
+                (details.get("cached_tokens", 0) if isinstance(details, dict) else 0) or 0,
+                role="optimizer",
+                agent="dspy",
+            )
+
+    return _LMCallback()
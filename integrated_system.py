@@ -1,12 +1,24 @@
 """High level integration layer tying all components together."""
 from __future__ import annotations
 
-from typing import List
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Deque, Dict, List, Tuple
 
+import analytics
 import config
+import instrumentation
+import llm_cache
+import llm_clients
+import log_sink
 import utils
 
 from god_agent import GodAgent
+from population_agent import PopulationAgent
 from wizard_agent import WizardAgent
 from advanced_features import PopulationGenerator
 from logging_system import StructuredLogger
@@ -20,47 +32,380 @@ class IntegratedSystem:
         self.generator = PopulationGenerator()
         self.god = GodAgent()
         self.wizard = WizardAgent(wizard_id="Wizard_001")
+        # Shard number in sharded runs (from 1); 0 when the run is not sharded
+        self.shard = 0
+        # Finished conversations waiting for their judge result, in order
+        self._pending: Deque[Tuple] = deque()
+        # State of the current run saved by ``_save_checkpoint``
+        self._checkpoint: Dict[str, Any] | None = None
+        self._checkpointed = 0
 
-    def run(self, instruction: str, n: int) -> None:
+    def run(self, instruction: str, n: int, shards: int = 1) -> None:
+        if shards > 1:
+            self.run_sharded(instruction, n, shards)
+            return
         run_no = utils.increment_run_number()
         self.wizard.set_run(run_no)
+        metrics = instrumentation.get_instrumentation()
+        metrics.reset(run_no)
 
         
         self.logger.log_event("system_start", instruction=instruction, n=n, run_no=run_no)
         specs = self.generator.generate(instruction, n)
-        population: List = []
-        for idx, spec in enumerate(specs):
-            agent = self.god.spawn_population(
-                spec.get("personality"), 1, run_no, idx + 1
-            )[0]
+        population = self._spawn(specs, run_no, 1)
+        if config.CHECKPOINT_EVERY:
+            self._checkpoint = {
+                "run_no": run_no,
+                "instruction": instruction,
+                "n": n,
+                "population": [_agent_record(pop) for pop in population],
+            }
+            self._save_checkpoint([], run_no)
+        summary = self._converse_all(population, run_no)
+        self._finish_run(summary, run_no, metrics)
+
+    def resume(self, run_no: int) -> None:
+        """Continue run ``run_no`` from its last checkpoint.
+
+        The population is rebuilt from the saved specs without calling the
+        GodAgent, the wizard's prompt and history are restored, and only the
+        conversations missing from the checkpoint are run.
+        """
+        try:
+            checkpoint = utils.load_json(_checkpoint_file(run_no))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No checkpoint found for run {run_no}") from None
+        self.wizard.set_run(run_no)
+        self.wizard.restore_state(checkpoint["wizard"])
+        metrics = instrumentation.get_instrumentation()
+        metrics.reset(run_no)
+        self._checkpoint = checkpoint
+        self._checkpointed = len(checkpoint["summary"])
+        completed = set(checkpoint["completed"])
+        population = [
+            PopulationAgent(**record)
+            for record in checkpoint["population"]
+            if record["agent_id"] not in completed
+        ]
+        self.logger.log_event(
+            "system_resume", run_no=run_no, completed=len(completed), remaining=len(population)
+        )
+        summary = self._converse_all(population, run_no, list(checkpoint["summary"]))
+        self._finish_run(summary, run_no, metrics)
+
+    def _finish_run(self, summary: List[dict], run_no: int, metrics: instrumentation.Instrumentation) -> None:
+        self._save_summary(summary, run_no)
+        self._log_process_stats(run_no)
+        self._log_turn_budget(summary, run_no)
+        self._log_opener_pool(run_no)
+        if config.INSTRUMENTATION_ENABLED:
+            self._export_metrics(metrics, run_no)
+        if self._checkpoint is not None:
+            # the run finished, so there is nothing left to resume
+            os.remove(os.path.join(config.LOGS_DIRECTORY, _checkpoint_file(run_no)))
+            self._checkpoint = None
+        self.logger.log_event("system_end", run_no=run_no)
+        print(f"Completed {len(summary)} conversations.")
+
+    def _save_summary(self, summary: List[dict], run_no: int) -> None:
+        utils.save_conversation_log(summary, f"summary_{run_no}.json", buffered=False)
+        if config.ANALYTICS_ENABLED:
+            analytics.AnalyticsStore().ingest_summary(run_no, summary)
+
+    def _save_checkpoint(self, summary: List[dict], run_no: int) -> None:
+        """Atomically write the run state needed by :meth:`resume`."""
+        if config.LOG_SINK_ENABLED:
+            # make the logs of completed conversations durable first
+            log_sink.get_sink().flush()
+        completed = [entry["pop_agent_id"] for entry in summary]
+        self._checkpoint.update(
+            completed=completed,
+            summary=summary,
+            wizard=self.wizard.checkpoint_state(completed),
+        )
+        utils.save_json_atomic(self._checkpoint, _checkpoint_file(run_no))
+        self._checkpointed = len(summary)
+        self.logger.log_event("checkpoint", run_no=run_no, completed=len(completed))
+
+    def run_sharded(self, instruction: str, n: int, shards: int) -> None:
+        """Split the population across ``shards`` worker processes.
+
+        The coordinator allocates the run number and persona specs, and each
+        shard gets a contiguous block of agent indices so IDs stay unique.
+        Workers run their conversations with their own wizard and log to
+        ``system_<run>_shard<k>.log``; the coordinator then merges the shard
+        summaries in population order, the LLM metrics and the structured
+        logs into the usual run outputs.
+
+        Each wizard counts prompt versions and applies
+        ``SELF_IMPROVE_AFTER`` to its own conversations, so summary entries
+        carry their ``shard`` and a version is only meaningful within it.
+        """
+        run_no = utils.increment_run_number()
+        metrics = instrumentation.get_instrumentation()
+        metrics.reset(run_no)
+        self.logger.log_event("system_start", instruction=instruction, n=n, run_no=run_no, shards=shards)
+        specs = self.generator.generate(instruction, n)
+        size = -(-len(specs) // shards)
+        parts = [(start, specs[start:start + size]) for start in range(0, len(specs), size)]
+        self._log_shard_schedule(parts, len(specs), run_no)
 
-            
-            population.append(agent)
+        # Workers are spawned fresh, so runtime changes to ``config`` are passed along.
+        overrides = {k: getattr(config, k) for k in dir(config) if k.isupper()}
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(parts), mp_context=context, max_tasks_per_child=1) as pool:
+            futures = [
+                pool.submit(_run_shard, overrides, shard_no, run_no, part, start + 1)
+                for shard_no, (start, part) in enumerate(parts, start=1)
+            ]
+            results = [future.result() for future in futures]
 
         summary: List[dict] = []
-        for pop in population:
-            log = self.wizard.converse_with(pop, show_live=config.SHOW_LIVE_CONVERSATIONS)
-            filename = f"{self.wizard.wizard_id}_{pop.agent_id}_{utils.get_timestamp().replace(':', '').replace('-', '')}.json"
-            utils.save_conversation_log(log, filename)
-            spec = pop.get_spec()
-            entry = {
-                "pop_agent_id": pop.agent_id,
-                "name": spec.get("name"),
-                "personality_description": spec.get("personality_description"),
-                "system_instruction": spec.get("system_instruction"),
-                "temperature": spec.get("llm_settings", {}).get("temperature"),
-                "max_tokens": spec.get("llm_settings", {}).get("max_tokens"),
-                "success": log["judge_result"].get("success"),
-                "score": log["judge_result"].get("score"),
-            }
-            summary.append(entry)
+        for shard_summary, snapshot in results:
+            summary.extend(shard_summary)
+            metrics.merge(snapshot)
+        self.logger.merge(_shard_logfile(run_no, shard_no) for shard_no in range(1, len(parts) + 1))
+        self._save_summary(summary, run_no)
+        self._log_turn_budget(summary, run_no)
+        if config.INSTRUMENTATION_ENABLED:
+            self._export_metrics(metrics, run_no)
+        self.logger.log_event("system_end", run_no=run_no, shards=len(parts))
+        print(f"Completed {len(summary)} conversations in {len(parts)} shards.")
+
+    def _log_shard_schedule(self, parts: List[Tuple[int, List[dict]]], n: int, run_no: int) -> None:
+        """Log the improvement points of each shard and warn about lost ones."""
+        wanted = self.wizard.improvement_points(n)
+        per_shard = [self.wizard.improvement_points(len(part)) for _, part in parts]
+        self.logger.log_event("improvement_schedule", run_no=run_no, unsharded=wanted, shards=per_shard)
+        lost = sorted(set(wanted) - set(per_shard[0]))
+        if lost:
+            print(
+                f"Sharding applies SELF_IMPROVE_AFTER per shard; improvements after "
+                f"conversations {lost} will not run (largest shard has {len(parts[0][1])})."
+            )
+
+    def run_shard(
+        self, run_no: int, specs: List[dict], start_index: int, shard_no: int = 0
+    ) -> Tuple[List[dict], Dict[str, Any]]:
+        """Run the conversations of one shard, returning its summary and metrics."""
+        self.shard = shard_no
+        self.wizard.set_run(run_no)
+        metrics = instrumentation.get_instrumentation()
+        metrics.reset(run_no)
+        self.logger.log_event(
+            "shard_start", run_no=run_no, shard=shard_no, start_index=start_index, n=len(specs)
+        )
+        population = self._spawn(specs, run_no, start_index)
+        summary = self._converse_all(population, run_no)
+        self._log_process_stats(run_no)
+        self._log_opener_pool(run_no)
+        self.logger.log_event("shard_end", run_no=run_no, start_index=start_index)
+        return summary, metrics.snapshot()
+
+    def _spawn(self, specs: List[dict], run_no: int, start_index: int) -> List:
+        """Create one population agent per spec, numbered from ``start_index``."""
+        population: List = []
+        if config.GOD_SPAWN_CHUNK_SIZE > 0:
+            population = self.god.spawn_population_bulk(
+                [spec.get("personality") for spec in specs], run_no, start_index
+            )
+        else:
+            for idx, spec in enumerate(specs, start=start_index):
+                agent = self.god.spawn_population(
+                    spec.get("personality"), 1, run_no, idx
+                )[0]
+
+                
+                population.append(agent)
+        return population
+
+    def _converse_all(self, population: List, run_no: int, summary: List[dict] | None = None) -> List[dict]:
+        """Run every conversation and return the summary entries in order.
+
+        ``summary`` holds the entries of conversations already completed
+        before a resume; new entries are appended to it.
+        """
+        summary = [] if summary is None else summary
+        if config.CONVERSATION_CONCURRENCY > 1:
+            utils.run_async(self._run_concurrent(population, summary, run_no))
+        else:
+            for pop in population:
+                log = self.wizard.converse_with(pop, show_live=config.SHOW_LIVE_CONVERSATIONS)
+                self._record_conversation(pop, log, summary, run_no)
+
+        if self.wizard.judge_queue is not None:
+            self.wizard.judge_queue.drain()
+        self._flush_judged(summary, run_no)
+        self.wizard.wait_for_improvements()
+        return summary
+
+    def _log_process_stats(self, run_no: int) -> None:
+        """Flush buffered logs and record this process's cache and pool stats."""
+        if config.LOG_SINK_ENABLED:
+            log_sink.get_sink().flush()
+        if config.LLM_CACHE_ENABLED:
+            self.logger.log_event("llm_cache", run_no=run_no, **llm_cache.get_cache().stats())
+        self.logger.log_event("llm_pool", run_no=run_no, **llm_clients.pool_stats())
+
+    async def _run_concurrent(self, population: List, summary: List[dict], run_no: int) -> None:
+        """Run conversations concurrently, recording them in population order.
+
+        At most ``config.CONVERSATION_CONCURRENCY`` conversations are in
+        flight at once. Results are committed to the wizard and recorded in
+        the order of ``population``, so the history buffer, self-improvement
+        points, log files, summary entries and structured events match the
+        serial mode.
+        """
+        semaphore = asyncio.Semaphore(config.CONVERSATION_CONCURRENCY)
+
+        async def _converse(pop):
+            # time spent waiting for a slot is reported as the first call's queue wait
+            with instrumentation.scope("wizard", self.wizard.wizard_id, pop.agent_id,
+                                       queued_at=time.perf_counter()):
+                async with semaphore:
+                    return await self.wizard.arun_conversation(
+                        pop, show_live=config.SHOW_LIVE_CONVERSATIONS
+                    )
+
+        tasks = [asyncio.create_task(_converse(pop)) for pop in population]
+        try:
+            # conversations finishing early wait in their task until their turn
+            for pop, task in zip(population, tasks):
+                log, result = await task
+                await self.wizard.afinish_conversation(log, result)
+                self._record_conversation(pop, log, summary, run_no)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _record_conversation(self, pop, log: dict, summary: List[dict], run_no: int) -> None:
+        """Queue a finished conversation and record every judged one so far."""
+        self._pending.append((pop, log))
+        self._flush_judged(summary, run_no)
+
+    def _flush_judged(self, summary: List[dict], run_no: int) -> None:
+        """Record pending conversations in order as their judge results arrive."""
+        while self._pending and "judge_result" in self._pending[0][1]:
+            pop, log = self._pending.popleft()
+            self._write_conversation(pop, log, summary, run_no)
+        if (
+            self._checkpoint is not None
+            and config.CHECKPOINT_EVERY
+            and len(summary) - self._checkpointed >= config.CHECKPOINT_EVERY
+        ):
+            self._save_checkpoint(summary, run_no)
+
+    def _write_conversation(self, pop, log: dict, summary: List[dict], run_no: int) -> None:
+        """Save the conversation log and append its summary entry."""
+        filename = f"{self.wizard.wizard_id}_{pop.agent_id}_{utils.get_timestamp().replace(':', '').replace('-', '')}.json"
+        utils.save_conversation_log(log.to_dict(), filename)
+        spec = pop.get_spec()
+        entry = {
+            "pop_agent_id": pop.agent_id,
+            "name": spec.get("name"),
+            "personality_description": spec.get("personality_description"),
+            "system_instruction": spec.get("system_instruction"),
+            "temperature": spec.get("llm_settings", {}).get("temperature"),
+            "max_tokens": spec.get("llm_settings", {}).get("max_tokens"),
+            "success": log["judge_result"].get("success"),
+            "score": log["judge_result"].get("score"),
+            "shard": self.shard,
+            "prompt_version": log.get("prompt_version"),
+            "turns": len(log["turns"]),
+            "stop_reason": log.get("stop_reason"),
+            "turns_saved": log.get("turns_saved"),
+        }
+        if config.INSTRUMENTATION_ENABLED:
+            calls = instrumentation.get_instrumentation().conversation_totals(pop.agent_id)
+            entry["llm_calls"] = calls["calls"]
+            entry["llm_tokens"] = calls["prompt_tokens"] + calls["completion_tokens"]
+            entry["llm_cost_usd"] = round(calls["cost_usd"], 6)
+        summary.append(entry)
+        usage = [t for t in log["turns"] if "prompt_tokens" in t]
+        if usage:
             self.logger.log_event(
-                "conversation_end",
+                "context_usage",
                 pop_agent=pop.agent_id,
-                success=entry["success"],
+                prompt_tokens=sum(t["prompt_tokens"] for t in usage),
+                uncompacted_tokens=sum(t["uncompacted_tokens"] for t in usage),
                 run_no=run_no,
             )
+        if "streaming" in log:
+            self.logger.log_event("streaming", pop_agent=pop.agent_id, run_no=run_no, **log["streaming"])
+        self.logger.log_event(
+            "conversation_end",
+            pop_agent=pop.agent_id,
+            success=entry["success"],
+            run_no=run_no,
+        )
 
-        utils.save_conversation_log(summary, f"summary_{run_no}.json")
-        self.logger.log_event("system_end", run_no=run_no)
-        print(f"Completed {len(population)} conversations.")
+    def _log_turn_budget(self, summary: List[dict], run_no: int) -> None:
+        """Log how many turns early stopping saved in the run."""
+        reasons: Dict[str, int] = {}
+        for entry in summary:
+            reason = entry.get("stop_reason") or "unknown"
+            reasons[reason] = reasons.get(reason, 0) + 1
+        saved = sum(entry.get("turns_saved") or 0 for entry in summary)
+        self.logger.log_event(
+            "turn_budget",
+            run_no=run_no,
+            detector=config.STOP_DETECTOR,
+            turns_saved=saved,
+            max_turns=config.MAX_TURNS * len(summary),
+            stop_reasons=reasons,
+        )
+        print(f"Early stopping saved {saved} of {config.MAX_TURNS * len(summary)} turns.")
+
+    def _log_opener_pool(self, run_no: int) -> None:
+        """Log how often the wizard's opener pool saved the first LLM call."""
+        if self.wizard.opener_pool is not None:
+            self.logger.log_event("opener_pool", run_no=run_no, **self.wizard.opener_pool.stats())
+
+    def _export_metrics(self, metrics: instrumentation.Instrumentation, run_no: int) -> None:
+        """Write the run's LLM call metrics as JSON and Prometheus text."""
+        snapshot = metrics.snapshot()
+        utils.save_conversation_log(snapshot, f"metrics_{run_no}.json", buffered=False)
+        utils.save_text(metrics.to_prometheus(), f"metrics_{run_no}.prom")
+        for role, totals in snapshot["by_role"].items():
+            cache = snapshot["prompt_cache"][role]
+            self.logger.log_event(
+                "llm_metrics",
+                run_no=run_no,
+                role=role,
+                **totals,
+                uncached_tokens=cache["uncached_tokens"],
+                cached_ratio=cache["cached_ratio"],
+            )
+
+
+def _checkpoint_file(run_no: int) -> str:
+    return f"checkpoint_{run_no}.json"
+
+
+def _agent_record(pop: PopulationAgent) -> Dict[str, Any]:
+    """Return the constructor arguments needed to rebuild ``pop``."""
+    return {
+        "agent_id": pop.agent_id,
+        "name": pop.name,
+        "personality_description": pop.personality_description,
+        "llm_settings": pop.llm_settings,
+    }
+
+
+def _shard_logfile(run_no: int, shard_no: int) -> str:
+    return os.path.join(config.LOGS_DIRECTORY, f"system_{run_no}_shard{shard_no}.log")
+
+
+def _run_shard(
+    overrides: Dict[str, Any], shard_no: int, run_no: int, specs: List[dict], start_index: int
+) -> Tuple[List[dict], Dict[str, Any]]:
+    """Worker process entry point for :meth:`IntegratedSystem.run_sharded`."""
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    # The first logger created in a process owns the handler
+    StructuredLogger(_shard_logfile(run_no, shard_no))
+    try:
+        return IntegratedSystem().run_shard(run_no, specs, start_index, shard_no)
+    finally:
+        # atexit hooks do not run in pool workers, so the sink is closed here
+        log_sink.close_sink()
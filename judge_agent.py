@@ -1,14 +1,19 @@
 """JudgeAgent evaluates conversation logs."""
 from __future__ import annotations
 
-from typing import Dict
-
-import json
-from langchain_openai import ChatOpenAI
+import queue
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Dict, List
 from langchain_core.messages import HumanMessage, SystemMessage
 
 
 import config
+import instrumentation
+import llm_clients
+import prompts
+import structured_output
 import utils
 
 
@@ -19,17 +24,171 @@ class JudgeAgent:
             "temperature": 0.3,
             "max_tokens": config.LLM_MAX_TOKENS,
         }
-        self.llm = ChatOpenAI(
-            model=self.llm_settings["model"],
-            temperature=self.llm_settings["temperature"],
-            max_tokens=self.llm_settings["max_tokens"],
-        )
-        self.template = judge_prompt_template or utils.load_template(config.JUDGE_PROMPT_TEMPLATE_PATH)
+        self.llm = llm_clients.get_chat_model(self.llm_settings)
+        if judge_prompt_template is not None:
+            self.template = prompts.compile_template(judge_prompt_template)
+        else:
+            self.template = prompts.load(config.JUDGE_PROMPT_TEMPLATE_PATH)
+        self.batch_template = prompts.load(config.JUDGE_BATCH_PROMPT_TEMPLATE_PATH)
+
+    @staticmethod
+    def _transcript(log: Dict) -> str:
+        return "\n".join([f"{t['speaker']}: {t['text']}" for t in log["turns"]])
+
+    def _build_messages(self, log: Dict) -> list:
+        transcript = self._transcript(log)
+        prompt = self.template.render({"goal": log.get("goal"), "transcript": transcript})
+        request = "Return JSON with success, score, rationale."
+        if "transcript" not in self.template.variables:
+            # the transcript follows the shared rubric so its prefix stays cacheable
+            request = f"Conversation:\n{transcript}\n\n{request}"
+        return [SystemMessage(content=prompt), HumanMessage(content=request)]
+
+    @staticmethod
+    def _result(result: Dict | None, problems: List[str]) -> Dict:
+        if problems:
+            # same shape as a failed background assessment
+            return {"success": None, "score": None, "error": f"invalid judge reply: {', '.join(problems)}"}
+        return result
 
     def assess(self, log: Dict) -> Dict:
-        transcript = "\n".join([f"{t['speaker']}: {t['text']}" for t in log["turns"]])
-        prompt = utils.render_template(self.template, {"goal": log.get("goal"), "transcript": transcript})
-        messages = [SystemMessage(content=prompt), HumanMessage(content="Return JSON with success, score, rationale.")]
+        """Assess ``log``, re-asking for fields missing from a malformed reply."""
+        messages = self._build_messages(log)
+        with instrumentation.scope("judge", "judge", log.get("pop_agent_id")):
+            reply = self.llm.invoke(messages).content
+            result, problems = structured_output.complete_object(
+                self.llm, messages, reply, structured_output.JUDGE_SCHEMA
+            )
+        return self._result(result, problems)
+
+    async def aassess(self, log: Dict) -> Dict:
+        """Async variant of :meth:`assess` using ``ainvoke``."""
+        messages = self._build_messages(log)
+        with instrumentation.scope("judge", "judge", log.get("pop_agent_id")):
+            reply = (await self.llm.ainvoke(messages)).content
+            result, problems = await structured_output.acomplete_object(
+                self.llm, messages, reply, structured_output.JUDGE_SCHEMA
+            )
+        return self._result(result, problems)
+
+    def assess_batch(self, logs: List[Dict]) -> List[Dict]:
+        """Assess several logs with one request returning a JSON array.
+
+        Logs missing from a malformed or short reply, or whose result fails
+        validation, are assessed one by one.
+        """
+        if len(logs) == 1:
+            return [self.assess(logs[0])]
+        conversations = "\n\n".join(
+            f"Conversation {i} (goal: {log.get('goal')}):\n{self._transcript(log)}"
+            for i, log in enumerate(logs, start=1)
+        )
+        prompt = self.batch_template.render({"conversations": conversations})
+        request = "Return the JSON array only."
+        if "conversations" not in self.batch_template.variables:
+            request = f"{conversations}\n\n{request}"
+        messages = [SystemMessage(content=prompt), HumanMessage(content=request)]
+        with instrumentation.scope("judge", "judge"):
+            reply = self.llm.invoke(messages).content
+        try:
+            results = structured_output.loads(reply, "[")
+        except structured_output.StructuredOutputError:
+            results = []
+        if not isinstance(results, list):
+            results = []
+        validated = [structured_output.validate(result, structured_output.JUDGE_SCHEMA)[0] for result in results]
+        return [
+            validated[i] if i < len(validated) and validated[i] is not None else self.assess(log)
+            for i, log in enumerate(logs)
+        ]
+
+
+class JudgeQueue:
+    """Evaluate finished conversation logs on background threads.
+
+    Submitted logs are grouped into batches of up to ``batch_size`` (waiting
+    at most ``linger`` seconds for a batch to fill) and assessed with
+    :meth:`JudgeAgent.assess_batch`. Each result is stored in the log's
+    ``judge_result`` before the returned future resolves. If assessment
+    fails the error is recorded in ``judge_result`` instead of being raised.
+    """
+
+    def __init__(
+        self,
+        judge: JudgeAgent,
+        batch_size: int | None = None,
+        linger: float | None = None,
+        workers: int | None = None,
+    ) -> None:
+        self.judge = judge
+        self.batch_size = batch_size or config.JUDGE_BATCH_SIZE
+        self.linger = linger if linger is not None else config.JUDGE_BATCH_LINGER_SECONDS
+        self._queue: queue.Queue = queue.Queue()
+        self._outstanding: set[Future] = set()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(workers or config.JUDGE_QUEUE_WORKERS)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, log: Dict) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self._outstanding.add(future)
+        future.add_done_callback(self._discard)
+        self._queue.put((log, future, time.perf_counter()))
+        return future
+
+    def _discard(self, future: Future) -> None:
+        with self._lock:
+            self._outstanding.discard(future)
+
+    def drain(self) -> None:
+        """Block until every submitted log has been assessed."""
+        with self._lock:
+            pending = list(self._outstanding)
+        wait(pending)
+
+    def _next_batch(self) -> List[tuple] | None:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # leave the shutdown marker for the next loop iteration
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            logs = [log for log, _, _ in batch]
+            queued_at = min(submitted for _, _, submitted in batch)
+            try:
+                with instrumentation.scope("judge", "judge", queued_at=queued_at):
+                    results = self.judge.assess_batch(logs)
+            except Exception as exc:  # keep the worker alive
+                results = [{"success": None, "score": None, "error": str(exc)} for _ in logs]
+            for (log, future, _), result in zip(batch, results):
+                log["judge_result"] = result
+                future.set_result(result)
 
-        result = self.llm.invoke(messages).content
-        return json.loads(result)
+    def close(self) -> None:
+        """Stop the worker threads once queued logs are processed."""
+        for _ in self._threads:
+            self._queue.put(None)
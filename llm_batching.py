@@ -0,0 +1,80 @@
+"""Coalesce concurrent async chat calls into batched requests.
+
+When several conversations run on asyncio they often wait on the same model
+at the same turn. :class:`BatchingChatModel` collects their ``ainvoke``
+calls and sends them together through ``abatch``. A batch is sent once it
+holds ``max_batch_size`` calls or ``linger`` seconds after its first call,
+and every reply (or error) is routed back to the call that made it.
+Synchronous and streaming calls are passed through unchanged.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Dict, List, Tuple
+
+
+class BatchingChatModel:
+    """Wrap a chat model so concurrent ``ainvoke`` calls share ``abatch`` requests."""
+
+    def __init__(self, llm: Any, max_batch_size: int, linger: float) -> None:
+        self.llm = llm
+        self.max_batch_size = max(max_batch_size, 1)
+        self.linger = linger
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.batched_calls = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    async def ainvoke(self, messages: Any, **kwargs: Any) -> Any:
+        if kwargs:
+            # per-call options cannot be shared by a batch
+            return await self.llm.ainvoke(messages, **kwargs)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((messages, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            # keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batched_calls += len(batch)
+        try:
+            replies = await self.llm.abatch([messages for messages, _ in batch], return_exceptions=True)
+        except Exception as exc:
+            replies = [exc] * len(batch)
+        for (_, future), reply in zip(batch, replies):
+            if future.done():
+                continue
+            if isinstance(reply, BaseException):
+                future.set_exception(reply)
+            else:
+                future.set_result(reply)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "batched_calls": self.batched_calls,
+                "mean_batch_size": round(self.batched_calls / self.batches, 2) if self.batches else 0.0,
+            }
@@ -0,0 +1,257 @@
+"""Persistent content-addressed cache for chat model responses."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+import config
+import utils
+
+
+def _serialize_messages(messages: Iterable[Any]) -> list:
+    serialized = []
+    for msg in messages:
+        if isinstance(msg, tuple):
+            role, content = msg
+        else:
+            role, content = getattr(msg, "type", type(msg).__name__), getattr(msg, "content", msg)
+        serialized.append([role, content])
+    return serialized
+
+
+def make_key(llm_settings: dict, messages: Iterable[Any], occurrence: int = 0) -> str:
+    """Return the cache key for a call with ``llm_settings`` and ``messages``.
+
+    ``occurrence`` distinguishes repeated identical calls in replay mode.
+    """
+    payload = {
+        "model": llm_settings.get("model"),
+        "temperature": llm_settings.get("temperature"),
+        "max_tokens": llm_settings.get("max_tokens"),
+        "top_p": llm_settings.get("top_p"),
+        "messages": _serialize_messages(messages),
+        "occurrence": occurrence,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed response store with size and TTL eviction."""
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_entries: int | None = None,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        self.path = path or utils.logs_path(config.LLM_CACHE_PATH)
+        self.max_entries = max_entries if max_entries is not None else config.LLM_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.LLM_CACHE_TTL_SECONDS
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._occurrences: Counter = Counter()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, content: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, content, now, now),
+            )
+            self._writes += 1
+            # Eviction scans the index, so only run it every so often.
+            if self._writes % 100 == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def next_occurrence(self, base_key: str) -> int:
+        """Return how many times ``base_key`` was requested before now."""
+        with self._lock:
+            occurrence = self._occurrences[base_key]
+            self._occurrences[base_key] += 1
+            return occurrence
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for this process."""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedChatModel:
+    """Wrap a chat model so its calls consult an :class:`LLMCache`.
+
+    ``invoke``, ``ainvoke``, ``batch``, ``abatch``, ``stream`` and ``astream``
+    are all cached. Batches only send their misses to the model, and a cached
+    reply is streamed as a single chunk. A stream is stored once it completes.
+
+    Calls with ``temperature > 0`` bypass the cache unless ``replay`` is set.
+    In replay mode the n-th identical sampled call made by this process,
+    across all models sharing the cache, maps to the n-th recorded response
+    so a re-run reproduces the original samples. Identical calls at
+    temperature 0 always share one entry.
+    """
+
+    def __init__(self, llm: Any, llm_settings: dict, cache: LLMCache, replay: bool = False) -> None:
+        self.llm = llm
+        self.llm_settings = llm_settings
+        self.cache = cache
+        self.replay = replay
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _key(self, messages: list) -> str | None:
+        sampled = (self.llm_settings.get("temperature") or 0) > 0
+        if sampled and not self.replay:
+            return None
+        base = make_key(self.llm_settings, messages)
+        if not sampled:
+            # deterministic calls give the same reply, so every repeat shares one entry
+            return base
+        occurrence = self.cache.next_occurrence(base)
+        return make_key(self.llm_settings, messages, occurrence) if occurrence else base
+
+    def invoke(self, messages: list, **kwargs: Any) -> AIMessage:
+        key = self._key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return AIMessage(content=cached)
+        response = self.llm.invoke(messages, **kwargs)
+        if key is not None:
+            self.cache.set(key, response.content)
+        return response
+
+    async def ainvoke(self, messages: list, **kwargs: Any) -> AIMessage:
+        key = self._key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return AIMessage(content=cached)
+        response = await self.llm.ainvoke(messages, **kwargs)
+        if key is not None:
+            self.cache.set(key, response.content)
+        return response
+
+    def _lookup_batch(self, inputs: List[list]) -> tuple[list, list, list]:
+        keys = [self._key(messages) for messages in inputs]
+        responses = [
+            None if key is None else self._cached_message(key) for key in keys
+        ]
+        misses = [i for i, response in enumerate(responses) if response is None]
+        return keys, responses, misses
+
+    def _cached_message(self, key: str) -> AIMessage | None:
+        cached = self.cache.get(key)
+        return None if cached is None else AIMessage(content=cached)
+
+    def _store_batch(self, keys: list, responses: list, misses: list, fresh: list) -> list:
+        for i, response in zip(misses, fresh):
+            responses[i] = response
+            if keys[i] is not None:
+                self.cache.set(keys[i], response.content)
+        return responses
+
+    def batch(self, inputs: List[list], **kwargs: Any) -> List[AIMessage]:
+        keys, responses, misses = self._lookup_batch(inputs)
+        fresh = self.llm.batch([inputs[i] for i in misses], **kwargs) if misses else []
+        return self._store_batch(keys, responses, misses, fresh)
+
+    async def abatch(self, inputs: List[list], **kwargs: Any) -> List[AIMessage]:
+        keys, responses, misses = self._lookup_batch(inputs)
+        fresh = await self.llm.abatch([inputs[i] for i in misses], **kwargs) if misses else []
+        return self._store_batch(keys, responses, misses, fresh)
+
+    def stream(self, messages: list, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        key = self._key(messages)
+        cached = None if key is None else self.cache.get(key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached)
+            return
+        parts = []
+        for chunk in self.llm.stream(messages, **kwargs):
+            parts.append(chunk.content)
+            yield chunk
+        # only a stream that ran to the end is a complete reply
+        if key is not None:
+            self.cache.set(key, "".join(parts))
+
+    async def astream(self, messages: list, **kwargs: Any):
+        key = self._key(messages)
+        cached = None if key is None else self.cache.get(key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached)
+            return
+        parts = []
+        async for chunk in self.llm.astream(messages, **kwargs):
+            parts.append(chunk.content)
+            yield chunk
+        if key is not None:
+            self.cache.set(key, "".join(parts))
+
+
+_shared_cache: LLMCache | None = None
+_shared_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Return the process-wide :class:`LLMCache`."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMCache()
+        return _shared_cache
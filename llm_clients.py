@@ -0,0 +1,139 @@
+"""Process-wide registry of the chat models used by the agents."""
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+import config
+import instrumentation
+import llm_batching
+import llm_cache
+import stub_llm
+
+if TYPE_CHECKING:
+    import httpx
+
+_models: Dict[Tuple, Any] = {}
+_batchers: List[llm_batching.BatchingChatModel] = []
+_lock = threading.Lock()
+_http_client: httpx.Client | None = None
+_http_async_client: httpx.AsyncClient | None = None
+_lookups = 0
+
+
+def _pool_key(llm_settings: dict) -> Tuple:
+    return (
+        llm_settings.get("model", config.LLM_MODEL),
+        llm_settings.get("temperature", config.LLM_TEMPERATURE),
+        llm_settings.get("max_tokens", config.LLM_MAX_TOKENS),
+        llm_settings.get("top_p"),
+    )
+
+
+def _limits() -> httpx.Limits:
+    import httpx
+
+    return httpx.Limits(
+        max_connections=config.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=config.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=config.LLM_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    global _http_client, _http_async_client
+    if _http_client is None:
+        import httpx
+
+        _http_client = httpx.Client(limits=_limits())
+        _http_async_client = httpx.AsyncClient(limits=_limits())
+    return _http_client, _http_async_client
+
+
+def _log_event(name: str, **data: Any) -> None:
+    # only log through a run's logger; creating one here would write
+    # ``logs/system.log`` into whatever directory the model is built in
+    from logging_system import get_active_logger
+
+    logger = get_active_logger()
+    if logger is not None:
+        logger.log_event(name, **data)
+
+
+def get_chat_model(llm_settings: dict) -> Any:
+    """Return the shared chat model for ``llm_settings``.
+
+    Models are pooled by ``(model, temperature, max_tokens, top_p)`` and all
+    of them share one keep-alive HTTP connection pool, so agents with the
+    same settings reuse a single client. With ``config.LLM_BACKEND`` set to
+    ``"stub"`` an offline :class:`stub_llm.StubChatModel` is used instead. With
+    ``config.LLM_BATCHING_ENABLED`` concurrent async calls are coalesced by a
+    :class:`llm_batching.BatchingChatModel`. When ``config.LLM_CACHE_ENABLED`` is
+    set the model is wrapped in a :class:`llm_cache.CachedChatModel`, and
+    with ``config.INSTRUMENTATION_ENABLED`` every call is recorded by an
+    :class:`instrumentation.InstrumentedChatModel`.
+    """
+    global _lookups
+    key = _pool_key(llm_settings)
+    with _lock:
+        _lookups += 1
+        model = _models.get(key)
+        if model is not None:
+            return model
+        model_name, temperature, max_tokens, top_p = key
+        kwargs = {"model": model_name, "temperature": temperature, "max_tokens": max_tokens}
+        if top_p is not None:
+            kwargs["top_p"] = top_p
+        if config.LLM_BACKEND == "stub":
+            model = stub_llm.StubChatModel(dict(kwargs))
+        else:
+            # only remote backends pay for importing the OpenAI client
+            from langchain_openai import ChatOpenAI
+
+            http_client, http_async_client = _http_clients()
+            model = ChatOpenAI(
+                **kwargs,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                # report token usage on the last streamed chunk as well
+                stream_usage=True,
+            )
+        if config.LLM_BATCHING_ENABLED:
+            # each conversation has at most one call in flight, so a batch
+            # holding every concurrent conversation is sent without lingering
+            max_size = min(config.LLM_BATCH_MAX_SIZE, max(config.CONVERSATION_CONCURRENCY, 1))
+            model = llm_batching.BatchingChatModel(model, max_size, config.LLM_BATCH_LINGER_SECONDS)
+            _batchers.append(model)
+        if config.LLM_CACHE_ENABLED:
+            model = llm_cache.CachedChatModel(
+                model, dict(kwargs), llm_cache.get_cache(), replay=config.LLM_CACHE_REPLAY
+            )
+        if config.INSTRUMENTATION_ENABLED:
+            model = instrumentation.InstrumentedChatModel(model, model_name)
+        _models[key] = model
+        constructed = len(_models)
+    _log_event("llm_client_created", model=model_name, temperature=temperature,
+               max_tokens=max_tokens, top_p=top_p, clients=constructed)
+    return model
+
+
+def _open_connections(client: httpx.Client | httpx.AsyncClient | None) -> int:
+    # httpx keeps its connection pool on the transport; fall back to 0 when
+    # the internals are not available in the installed version.
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return len(getattr(pool, "connections", ()) or ())
+
+
+def pool_stats() -> Dict[str, int]:
+    """Return client construction and connection counts for this process."""
+    with _lock:
+        stats = {
+            "clients": len(_models),
+            "lookups": _lookups,
+            "connections": _open_connections(_http_client) + _open_connections(_http_async_client),
+        }
+        if _batchers:
+            batches = [b.stats() for b in _batchers]
+            stats["batches"] = sum(b["batches"] for b in batches)
+            stats["batched_calls"] = sum(b["batched_calls"] for b in batches)
+        return stats
@@ -0,0 +1,239 @@
+"""Buffered background writer storing log records in rotating JSONL segments."""
+from __future__ import annotations
+
+import argparse
+import atexit
+import gzip
+import io
+import json
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Iterator, Tuple
+
+import config
+import utils
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd optional
+    zstandard = None
+
+_EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _open_segment(path: str, compression: str | None) -> io.TextIOBase:
+    # exclusive creation: an existing segment is never truncated
+    if compression is None:
+        return open(path, "x", encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, "xt", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        raw = open(path, "xb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw), encoding="utf-8")
+    raise ValueError(f"Unknown log compression: {compression!r}")
+
+
+def _read_segment(path: str) -> Iterator[str]:
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            try:
+                yield from fh
+            except EOFError:
+                # segment still being written: stop at the last flushed line
+                return
+    elif path.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("reading zstd segments requires the 'zstandard' package")
+        with open(path, "rb") as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw)
+            yield from io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        with open(path, "r", encoding="utf-8") as fh:
+            yield from fh
+
+
+class LogSink:
+    """Append JSON records to rotating segment files on a writer thread.
+
+    :meth:`write` only serialises the record and queues it; the writer thread
+    appends queued lines in batches to ``segment_<time>_<pid>_<id>_<n>.jsonl``
+    files, optionally gzip or zstd compressed, and starts a new segment once
+    ``max_records`` or ``max_bytes`` is reached. Each sink names its segments
+    with its start time and a random id, so other sinks and later runs never
+    overwrite them. Every line holds the original
+    ``filename`` and ``record`` so :func:`export_segments` can recreate the
+    one-file-per-log layout. Pending records are flushed at interpreter exit.
+    If the writer thread fails, later records are dropped and the error is
+    raised from the next :meth:`write`, :meth:`flush` or :meth:`close`.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_records: int | None = None,
+        max_bytes: int | None = None,
+        compression: str | None = None,
+    ) -> None:
+        self.directory = directory or utils.logs_path(config.LOG_SINK_DIRECTORY)
+        self.max_records = max_records or config.LOG_SINK_SEGMENT_MAX_RECORDS
+        self.max_bytes = max_bytes or config.LOG_SINK_SEGMENT_MAX_BYTES
+        self.compression = compression if compression is not None else config.LOG_SINK_COMPRESSION
+        if self.compression not in _EXTENSIONS:
+            raise ValueError(f"Unknown log compression: {self.compression!r}")
+        if self.compression == "zstd" and zstandard is None:
+            # fail here rather than on the writer thread at the first record
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue: queue.Queue = queue.Queue()
+        self._segment_no = 0
+        self._prefix = (
+            f"segment_{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        )
+        self._fh: io.TextIOBase | None = None
+        self._records = 0
+        self._bytes = 0
+        self._closed = False
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, filename: str, record: Any) -> None:
+        """Queue ``record`` to be stored under the logical ``filename``."""
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError("LogSink is closed")
+        line = json.dumps({"file": filename, "record": record}, default=str)
+        self._queue.put(line + "\n")
+
+    def flush(self) -> None:
+        """Block until every queued record has been written."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Flush pending records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _rotate(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+        self._segment_no += 1
+        name = f"{self._prefix}_{self._segment_no:05d}{_EXTENSIONS[self.compression]}"
+        self._fh = _open_segment(os.path.join(self.directory, name), self.compression)
+        self._records = 0
+        self._bytes = 0
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is already queued so lines are written together.
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                # after a failure records are dropped so flush and close never block
+                if self._error is None:
+                    self._write_batch([line for line in batch if line is not None])
+                    if stop and self._fh is not None:
+                        self._fh.close()
+                        self._fh = None
+            except Exception as exc:
+                self._error = exc
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, lines: list) -> None:
+        for line in lines:
+            if self._fh is None or self._records >= self.max_records or self._bytes >= self.max_bytes:
+                self._rotate()
+            self._fh.write(line)
+            self._records += 1
+            self._bytes += len(line)
+        if self._fh is not None:
+            self._fh.flush()
+
+
+def iter_segments(directory: str | None = None) -> Iterator[Tuple[str, Any]]:
+    """Yield ``(filename, record)`` pairs from every segment in ``directory``."""
+    directory = directory or utils.logs_path(config.LOG_SINK_DIRECTORY)
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("segment_"):
+            continue
+        for line in _read_segment(os.path.join(directory, name)):
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["file"], entry["record"]
+
+
+def export_segments(directory: str | None = None, out_dir: str | None = None) -> int:
+    """Write every segment record to its own JSON file, returning the count."""
+    out_dir = out_dir or config.LOGS_DIRECTORY
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    for filename, record in iter_segments(directory):
+        with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as fh:
+            json.dump(record, fh, indent=config.JSON_INDENT, default=str)
+        count += 1
+    return count
+
+
+_sink: LogSink | None = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> LogSink:
+    """Return the process-wide :class:`LogSink`."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = LogSink()
+        return _sink
+
+
+def close_sink() -> None:
+    """Close the process-wide sink, if one was created.
+
+    ``atexit`` hooks do not run in multiprocessing workers, so worker
+    processes call this before they return.
+    """
+    global _sink
+    with _sink_lock:
+        sink, _sink = _sink, None
+    if sink is not None:
+        sink.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export JSONL log segments to per-file JSON logs.")
+    parser.add_argument(
+        "--segments", default=utils.logs_path(config.LOG_SINK_DIRECTORY), help="segment directory"
+    )
+    parser.add_argument("--out", default=config.LOGS_DIRECTORY, help="output directory")
+    args = parser.parse_args()
+    count = export_segments(args.segments, args.out)
+    print(f"Exported {count} records to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,34 @@
 """Structured JSON logging utilities with performance tracking."""
 from __future__ import annotations
 
+import glob
 import json
 import logging
+import os
 import time
 from logging.handlers import RotatingFileHandler
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List
 
+import config
 import utils
 
 
+_active: StructuredLogger | None = None
+
+
+def get_active_logger() -> StructuredLogger | None:
+    """Return the most recently created logger, or ``None`` outside a run."""
+    return _active
+
+
 class StructuredLogger:
     """A simple structured logger that writes JSON lines."""
 
-    def __init__(self, logfile: str = "logs/system.log", max_bytes: int = 1048576, backup_count: int = 5) -> None:
+    def __init__(self, logfile: str | None = None, max_bytes: int = 1048576, backup_count: int = 5) -> None:
+        global _active
+        _active = self
         utils.ensure_logs_dir()
+        logfile = logfile or os.path.join(config.LOGS_DIRECTORY, "system.log")
         self.logger = logging.getLogger("structured")
         if not self.logger.handlers:
             handler = RotatingFileHandler(logfile, maxBytes=max_bytes, backupCount=backup_count)
@@ -26,3 +40,28 @@ class StructuredLogger:
         entry: Dict[str, Any] = {"event": name, "ts": time.time()}
         entry.update(data)
         self.logger.info(json.dumps(entry))
+
+    def merge(self, logfiles: Iterable[str], remove: bool = True) -> int:
+        """Append the events of other log files in timestamp order.
+
+        Rotated backups (``<logfile>.1`` ...) are included. The merged files
+        are deleted when ``remove`` is set. Returns the number of events.
+        """
+        entries: List[tuple] = []
+        merged: List[str] = []
+        for logfile in logfiles:
+            backups = sorted(glob.glob(f"{logfile}.*"), key=lambda p: -int(p.rsplit(".", 1)[1]))
+            for path in backups + [logfile]:
+                if not os.path.exists(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as fh:
+                    for line in fh:
+                        if line.strip():
+                            entries.append((json.loads(line).get("ts", 0), len(entries), line.rstrip("\n")))
+                merged.append(path)
+        for _, _, line in sorted(entries):
+            self.logger.info(line)
+        if remove:
+            for path in merged:
+                os.remove(path)
+        return len(entries)
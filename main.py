@@ -1,13 +1,26 @@
 """Unified entry point running the integrated system."""
 from __future__ import annotations
 
+import argparse
+
 import config
 from integrated_system import IntegratedSystem
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the wizard/population simulation.")
+    parser.add_argument(
+        "--shards", type=int, default=config.RUN_SHARDS, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--resume", type=int, metavar="RUN_NO", help="continue an interrupted run from its checkpoint"
+    )
+    args = parser.parse_args()
     system = IntegratedSystem()
-    system.run("Generate population", config.POPULATION_SIZE)
+    if args.resume is not None:
+        system.resume(args.resume)
+    else:
+        system.run("Generate population", config.POPULATION_SIZE, shards=args.shards)
 
 
 if __name__ == "__main__":
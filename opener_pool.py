@@ -0,0 +1,98 @@
+"""Shared first wizard messages for conversations on the same prompt.
+
+Every conversation opens with the wizard replying to its system prompt and
+an empty history, so the first turn only depends on the prompt version.
+:class:`OpenerPool` samples up to ``size`` distinct openers for a version in
+one batched call and hands them out round-robin or at random, removing the
+first LLM call from every later conversation. The pool is refilled whenever
+a conversation asks for a different prompt version.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+from typing import Any, Dict, List, Tuple
+
+
+class OpenerPool:
+    """Pre-sampled openers for the current prompt version.
+
+    ``selection`` is ``"round_robin"`` or ``"random"``. :meth:`stats`
+    reports how many openers were generated and served. ``reuse_rate`` is
+    ``1 - generated / served``, the share of LLM calls saved; it is negative
+    while the pool has sampled more openers than it served.
+    """
+
+    def __init__(self, llm: Any, size: int, selection: str = "round_robin", seed: int | None = None) -> None:
+        if selection not in ("round_robin", "random"):
+            raise ValueError(f"Unknown opener selection {selection!r}")
+        self.llm = llm
+        self.size = size
+        self.selection = selection
+        self._random = random.Random(seed)
+        self._version: int | None = None
+        self._openers: List[str] = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self._async_lock: asyncio.Lock | None = None
+        self.generated = 0
+        self.served = 0
+        self.refills = 0
+
+    def invalidate(self) -> None:
+        """Drop the openers, e.g. after the prompt changed."""
+        with self._lock:
+            self._version = None
+            self._openers = []
+
+    def _fill(self, version: int, replies: List[Any]) -> None:
+        # identical samples are only kept once
+        self._openers = list(dict.fromkeys(reply.content for reply in replies))
+        self._version = version
+        self._next = 0
+        self.generated += len(replies)
+        self.refills += 1
+
+    def _take(self) -> Tuple[str, int]:
+        if self.selection == "random":
+            index = self._random.randrange(len(self._openers))
+        else:
+            index = self._next % len(self._openers)
+            self._next += 1
+        self.served += 1
+        return self._openers[index], index
+
+    def get(self, messages: List, version: int) -> Tuple[str, int]:
+        """Return an opener for ``version`` and its index in the pool.
+
+        ``messages`` are the wizard's opening messages, used to sample the
+        pool if it does not hold openers for ``version`` yet.
+        """
+        with self._lock:
+            if self._version != version or not self._openers:
+                self._fill(version, self.llm.batch([messages] * self.size))
+            return self._take()
+
+    async def aget(self, messages: List, version: int) -> Tuple[str, int]:
+        """Async variant of :meth:`get`; concurrent callers share one fill."""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._version != version or not self._openers:
+                replies = await self.llm.abatch([messages] * self.size)
+                with self._lock:
+                    self._fill(version, replies)
+            with self._lock:
+                return self._take()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "selection": self.selection,
+                "generated": self.generated,
+                "served": self.served,
+                "refills": self.refills,
+                "reuse_rate": round(1 - self.generated / self.served, 4) if self.served else 0.0,
+            }
@@ -1,12 +1,14 @@
 """Defines the PopulationAgent persona."""
-from typing import List, Tuple
-
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from typing import Callable, List, Tuple
 
 
 import config
+import instrumentation
+import llm_clients
+import streaming
 import utils
+from context_manager import count_tokens, get_context_manager
+from conversation import ConversationState
 
 
 class PopulationAgent:
@@ -18,30 +20,71 @@ class PopulationAgent:
         self.personality_description = personality_description
         self.llm_settings = llm_settings
         self.state = "undecided"
-        self.history: List[Tuple[str, str]] = []  # (speaker, text)
+        self.context = get_context_manager()
+        self.conversation = self._new_conversation()
+        # Prompt token usage of the last reply when compaction is enabled
+        self.last_usage: dict = {}
+        # Stream statistics of the last reply when streaming is enabled
+        self.last_stream: dict = {}
         self.system_instruction = (
             f"You are {self.name}. {self.personality_description}. Respond accordingly."
         )
-        self.llm = ChatOpenAI(
-            model=llm_settings.get("model", config.LLM_MODEL),
-            temperature=llm_settings.get("temperature", config.LLM_TEMPERATURE),
-            max_tokens=llm_settings.get("max_tokens", config.LLM_MAX_TOKENS),
-        )
+        self.llm = llm_clients.get_chat_model(llm_settings)
+        self._spec: dict | None = None
+
+    def _new_conversation(self, include_wizard: bool = False) -> ConversationState:
+        windows = {"pop": config.POP_HISTORY_LIMIT}
+        if include_wizard:
+            windows["wizard"] = None
+        counter = count_tokens if self.context is not None else None
+        return ConversationState(windows, turn_limit=config.POP_HISTORY_LIMIT, token_counter=counter)
+
+    @property
+    def history(self) -> List[Tuple[str, str]]:
+        """Return the remembered ``(speaker, text)`` turns."""
+        return [(turn.speaker, turn.text) for turn in self.conversation.turns]
 
-    def respond_to(self, user_message: str) -> str:
-        messages = [SystemMessage(content=self.system_instruction)]
-        for speaker, text in self.history:
-            if speaker == "wizard":
-                messages.append(HumanMessage(content=text))
+    def start_conversation(self) -> ConversationState:
+        """Start a fresh conversation whose state is shared with the wizard."""
+        self.conversation = self._new_conversation(include_wizard=True)
+        return self.conversation
+
+    def respond_to(self, user_message: str, stop_when: Callable[[str], bool] | None = None) -> str:
+        """Reply to ``user_message``.
+
+        With ``config.STREAM_RESPONSES`` the reply is streamed and generation
+        stops as soon as ``stop_when`` returns true for the text so far.
+        """
+        self.conversation.append("wizard", user_message)
+        with instrumentation.scope("pop", self.agent_id, self.agent_id):
+            if self.context is None:
+                messages = self.conversation.messages_for("pop", self.system_instruction)
             else:
-                messages.append(AIMessage(content=text))
-        messages.append(HumanMessage(content=user_message))
-        response = self.llm.invoke(messages).content
+                messages, self.last_usage = self.context.prepare(
+                    self.conversation, "pop", self.system_instruction
+                )
+            if config.STREAM_RESPONSES:
+                response, self.last_stream = streaming.stream_reply(self.llm, messages, stop_when)
+            else:
+                response = self.llm.invoke(messages).content
+        self.conversation.append("pop", response)
+        return response
 
-        self.history.append(("wizard", user_message))
-        self.history.append(("pop", response))
-        if len(self.history) > config.POP_HISTORY_LIMIT:
-            self.history = self.history[-config.POP_HISTORY_LIMIT:]
+    async def arespond_to(self, user_message: str, stop_when: Callable[[str], bool] | None = None) -> str:
+        """Async variant of :meth:`respond_to` using ``ainvoke``/``astream``."""
+        self.conversation.append("wizard", user_message)
+        with instrumentation.scope("pop", self.agent_id, self.agent_id):
+            if self.context is None:
+                messages = self.conversation.messages_for("pop", self.system_instruction)
+            else:
+                messages, self.last_usage = await self.context.aprepare(
+                    self.conversation, "pop", self.system_instruction
+                )
+            if config.STREAM_RESPONSES:
+                response, self.last_stream = await streaming.astream_reply(self.llm, messages, stop_when)
+            else:
+                response = (await self.llm.ainvoke(messages)).content
+        self.conversation.append("pop", response)
         return response
 
     def get_persona(self) -> dict:
@@ -52,13 +95,20 @@ class PopulationAgent:
         }
 
     def get_spec(self) -> dict:
-        """Return a spec dictionary describing this population agent."""
-        return {
-            "name": self.name,
-            "personality_description": self.personality_description,
-            "system_instruction": self.system_instruction,
-            "llm_settings": self.llm_settings,
-        }
+        """Return a spec dictionary describing this population agent.
+
+        The dictionary is built once and shared by every conversation log of
+        this agent, so it must not be modified.
+        """
+        if self._spec is None:
+            self._spec = {
+                "name": self.name,
+                "personality_description": self.personality_description,
+                "system_instruction": self.system_instruction,
+                "llm_settings": self.llm_settings,
+            }
+        return self._spec
 
     def reset_history(self) -> None:
-        self.history = []
+        self.conversation = self._new_conversation()
+        self.last_usage = {}
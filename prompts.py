@@ -0,0 +1,54 @@
+"""Precompiled prompt templates.
+
+Templates are split once into literal text and ``{{name}}`` placeholders,
+so rendering is a single join instead of one ``str.replace`` pass per
+variable. Files under ``templates/`` are read and compiled once per process.
+
+The agents keep the text shared by every call of a role (instructions,
+rubric, output format) in the system message and send the per-call content
+(transcripts, persona counts, summaries) last, in the human message.
+Providers cache prompts by exact prefix, so this layout lets repeated calls
+reuse the cached system message.
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Any, Dict
+
+_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+class Template:
+    """A template compiled into alternating literal and placeholder parts."""
+
+    __slots__ = ("source", "variables", "_parts")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        # even indices are literal text, odd indices placeholder names
+        self._parts = _PLACEHOLDER.split(source)
+        self.variables = frozenset(self._parts[1::2])
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        """Substitute ``variables``; unknown placeholders are left as they are."""
+        if not self.variables:
+            return self.source
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            parts[i] = str(variables[name]) if name in variables else f"{{{{{name}}}}}"
+        return "".join(parts)
+
+
+@lru_cache(maxsize=256)
+def compile_template(source: str) -> Template:
+    """Return the compiled :class:`Template` for ``source``."""
+    return Template(source)
+
+
+@lru_cache(maxsize=None)
+def load(path: str) -> Template:
+    """Read and compile the template file at ``path`` once."""
+    with open(path, "r", encoding="utf-8") as fh:
+        return compile_template(fh.read())
@@ -0,0 +1,169 @@
+"""Early stopping of conversations based on the population agent's replies.
+
+A detector scores every population reply for ``accept``, ``refuse`` and
+``stall`` in ``[0, 1]``. :class:`TurnMonitor` turns those scores into a
+decision: a conversation ends on the first accepting reply, or once
+``STOP_REFUSE_TURNS`` (``STOP_STALL_TURNS``) consecutive replies reach the
+refuse (stall) threshold.
+
+``STOP_DETECTOR`` selects the classifier:
+
+* ``"keyword"`` - the original test for ``"buy"`` in the reply.
+* ``"regex"`` - phrase lists compiled once into one pattern per label.
+* ``"ngram"`` - word unigrams and bigrams scored with NumPy. Words are
+  reduced to a crude stem, so "buying" matches "buy". A label's score is the
+  best fraction of a phrase's n-grams found in the reply, and phrases of up
+  to ``_SHORT_PHRASE`` words only score when all their n-grams are present.
+  A reply repeating the previous one counts as stalling.
+
+Both phrase detectors never accept a reply that also refuses or stalls.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, Sequence
+
+import numpy as np
+
+import config
+
+LABELS = ("accept", "refuse", "stall")
+
+ACCEPT_PHRASES = (
+    "buy", "buying", "purchase", "i'll take it", "i will take it", "sign me up", "count me in", "order it",
+)
+REFUSE_PHRASES = (
+    "not interested", "no thanks", "no thank you", "don't want", "do not want", "won't buy", "will not buy",
+    "not buying", "not going to buy", "leave me alone", "can't afford", "too expensive",
+)
+STALL_PHRASES = (
+    "let me think", "think about it", "maybe later", "not sure", "need more time", "get back to you",
+    "not right now", "need to compare",
+)
+
+_SHORT_PHRASE = 4
+_WORD = re.compile(r"[a-z0-9']+")
+_SUFFIX = re.compile(r"(?:ing|ed|es|s)$")
+
+
+class KeywordStopDetector:
+    """Accept as soon as a reply mentions ``"buy"``; never refuse or stall."""
+
+    def scores(self, text: str, previous: str | None = None) -> Dict[str, float]:
+        return {"accept": float("buy" in text.lower()), "refuse": 0.0, "stall": 0.0}
+
+    def accepts(self, text: str) -> bool:
+        return self.scores(text)["accept"] >= config.STOP_ACCEPT_THRESHOLD
+
+
+class RegexStopDetector(KeywordStopDetector):
+    """Score a label 1 when a reply contains one of its phrases, else 0.
+
+    Refusals are removed before looking for stalling, and a reply with a
+    refusal or stall never accepts, so "I don't want to buy this" refuses.
+    """
+
+    def __init__(
+        self,
+        accept: Sequence[str] = ACCEPT_PHRASES,
+        refuse: Sequence[str] = REFUSE_PHRASES,
+        stall: Sequence[str] = STALL_PHRASES,
+    ) -> None:
+        self._patterns = {
+            label: re.compile(r"\b(?:" + "|".join(re.escape(p) for p in phrases) + r")\b", re.IGNORECASE)
+            for label, phrases in (("accept", accept), ("refuse", refuse), ("stall", stall))
+        }
+
+    def scores(self, text: str, previous: str | None = None) -> Dict[str, float]:
+        remaining, refusals = self._patterns["refuse"].subn(" ", text)
+        stall = self._patterns["stall"].search(remaining) is not None
+        accept = not refusals and not stall and self._patterns["accept"].search(text) is not None
+        return {"accept": float(accept), "refuse": float(refusals > 0), "stall": float(stall)}
+
+
+def _ngrams(text: str) -> FrozenSet[str]:
+    """Return the word unigrams and bigrams of ``text``."""
+    words = [_SUFFIX.sub("", w) if len(w) > 3 else w for w in _WORD.findall(text.lower())]
+    return frozenset(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+class NgramStopDetector(KeywordStopDetector):
+    """Score replies by n-gram overlap with the phrases of each label.
+
+    The phrases are vectorised once into one matrix over their exact
+    n-grams, so a reply is scored with a single matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        accept: Sequence[str] = ACCEPT_PHRASES,
+        refuse: Sequence[str] = REFUSE_PHRASES,
+        stall: Sequence[str] = STALL_PHRASES,
+    ) -> None:
+        groups = (("accept", accept), ("refuse", refuse), ("stall", stall))
+        grams = [_ngrams(p) for _, phrases in groups for p in phrases]
+        self._vocabulary = {g: i for i, g in enumerate(sorted(set().union(*grams)))}
+        self._matrix = np.zeros((len(grams), len(self._vocabulary)), dtype=np.float32)
+        for row, phrase in enumerate(grams):
+            self._matrix[row, [self._vocabulary[g] for g in phrase]] = 1.0
+        self._sizes = self._matrix.sum(axis=1)
+        self._short = np.array(
+            [len(p.split()) <= _SHORT_PHRASE for _, phrases in groups for p in phrases]
+        )
+        self._labels = np.array([label for label, phrases in groups for _ in phrases])
+
+    def scores(self, text: str, previous: str | None = None) -> Dict[str, float]:
+        grams = _ngrams(text)
+        vector = np.zeros(len(self._vocabulary), dtype=np.float32)
+        vector[[self._vocabulary[g] for g in grams if g in self._vocabulary]] = 1.0
+        # fraction of each phrase's n-grams present in the reply
+        containment = (self._matrix @ vector) / self._sizes
+        containment[self._short & (containment < 1.0)] = 0.0
+        scores = {label: float(containment[self._labels == label].max()) for label in LABELS}
+        if scores["refuse"] or scores["stall"]:
+            scores["accept"] = 0.0
+        if previous:
+            other = _ngrams(previous)
+            if grams and other:
+                repeated = len(grams & other) / (len(grams) * len(other)) ** 0.5
+                scores["stall"] = max(scores["stall"], repeated)
+        return scores
+
+
+_DETECTORS = {"keyword": KeywordStopDetector, "regex": RegexStopDetector, "ngram": NgramStopDetector}
+_shared: Dict[str, KeywordStopDetector] = {}
+
+
+def get_stop_detector() -> KeywordStopDetector:
+    """Return the shared detector selected by ``config.STOP_DETECTOR``."""
+    name = config.STOP_DETECTOR
+    if name not in _DETECTORS:
+        raise ValueError(f"Unknown STOP_DETECTOR {name!r}; expected one of {sorted(_DETECTORS)}")
+    if name not in _shared:
+        _shared[name] = _DETECTORS[name]()
+    return _shared[name]
+
+
+class TurnMonitor:
+    """Decide after each population reply whether a conversation should end."""
+
+    def __init__(self, detector: KeywordStopDetector) -> None:
+        self.detector = detector
+        self._previous: str | None = None
+        self._streaks = {"refuse": 0, "stall": 0}
+
+    def observe(self, text: str) -> str | None:
+        """Return ``"accept"``, ``"refuse"`` or ``"stall"`` to stop, else ``None``."""
+        scores = self.detector.scores(text, self._previous)
+        self._previous = text
+        if scores["accept"] >= config.STOP_ACCEPT_THRESHOLD:
+            return "accept"
+        limits = (
+            ("refuse", config.STOP_REFUSE_THRESHOLD, config.STOP_REFUSE_TURNS),
+            ("stall", config.STOP_STALL_THRESHOLD, config.STOP_STALL_TURNS),
+        )
+        for label, threshold, turns in limits:
+            self._streaks[label] = self._streaks[label] + 1 if scores[label] >= threshold else 0
+            if self._streaks[label] >= turns:
+                return label
+        return None
@@ -0,0 +1,83 @@
+"""Helpers for streaming chat replies with optional early cut-off."""
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+StopCondition = Callable[[str], bool]
+
+
+def _stats(start: float, first: float | None, chunks: int, stopped: bool) -> Dict[str, Any]:
+    return {
+        "ttft": None if first is None else round(first - start, 4),
+        "completion_chunks": chunks,
+        "stopped_early": stopped,
+    }
+
+
+def stream_reply(llm: Any, messages: List, stop_when: StopCondition | None = None) -> Tuple[str, Dict[str, Any]]:
+    """Stream a reply from ``llm`` and return ``(text, stats)``.
+
+    ``stop_when`` is called with the accumulated text after every chunk.
+    When it returns true the stream is closed, which aborts the request, and
+    the text received so far is returned. ``stats`` holds the time to first
+    token (``ttft``), the number of chunks received (about one per token) and
+    whether generation was stopped early.
+    """
+    start = time.perf_counter()
+    first = None
+    parts: List[str] = []
+    stopped = False
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            if first is None:
+                first = time.perf_counter()
+            parts.append(chunk.content)
+            if stop_when is not None and stop_when("".join(parts)):
+                stopped = True
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return "".join(parts), _stats(start, first, len(parts), stopped)
+
+
+async def astream_reply(
+    llm: Any, messages: List, stop_when: StopCondition | None = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Async variant of :func:`stream_reply` using ``astream``."""
+    start = time.perf_counter()
+    first = None
+    parts: List[str] = []
+    stopped = False
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            if first is None:
+                first = time.perf_counter()
+            parts.append(chunk.content)
+            if stop_when is not None and stop_when("".join(parts)):
+                stopped = True
+                break
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    return "".join(parts), _stats(start, first, len(parts), stopped)
+
+
+def summarize(turn_stats: List[Dict[str, Any]], max_tokens: int) -> Dict[str, Any]:
+    """Aggregate per-turn stream stats for one conversation.
+
+    ``max_tokens_saved`` is an upper bound: the completion budget left unused
+    by replies that were cut off early.
+    """
+    ttfts = [s["ttft"] for s in turn_stats if s.get("ttft") is not None]
+    early = [s for s in turn_stats if s.get("stopped_early")]
+    return {
+        "mean_ttft": round(sum(ttfts) / len(ttfts), 4) if ttfts else None,
+        "early_stops": len(early),
+        "max_tokens_saved": sum(max(max_tokens - s["completion_chunks"], 0) for s in early),
+    }
@@ -0,0 +1,388 @@
+"""Parsing, repair and validation of JSON replies from the chat models.
+
+Replies are parsed leniently: code fences, surrounding prose, trailing
+commas, single quotes, Python literals and truncated output are repaired
+before giving up. :class:`JsonArrayStream` yields the elements of a JSON
+array while it is still streaming. Parsed values are checked against a
+small schema and, when items or fields are missing, the model is asked once
+more for just those instead of rerunning the whole request.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import config
+
+# field -> (type, required)
+Schema = Dict[str, Tuple[type, bool]]
+
+PERSONA_SCHEMA: Schema = {"name": (str, True), "personality": (str, True)}
+JUDGE_SCHEMA: Schema = {"success": (bool, True), "score": (float, True), "rationale": (str, False)}
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+_TYPE_NAMES = {str: "string", bool: "boolean", float: "number", int: "integer"}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a reply cannot be turned into the expected JSON value."""
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        end = text.rfind("```")
+        if end >= 0:
+            text = text[:end]
+    return text
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+def repair(text: str, opener: str | None = None) -> str:
+    """Return ``text`` rewritten as (hopefully) valid JSON.
+
+    The value starts at the first ``opener`` (``[`` or ``{``, either when
+    ``None``) and ends where its brackets balance; anything around it is
+    dropped. Truncated values are closed.
+    """
+    text = _strip_fences(text)
+    openers = opener or "[{"
+    start = min((i for i in (text.find(o) for o in openers) if i >= 0), default=-1)
+    if start < 0:
+        return text
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote is not None:
+            if ch == "\\" and i + 1 < len(text):
+                nxt = text[i + 1]
+                # ``\'`` is not a JSON escape
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "“”":
+            quote = "”"
+            out.append('"')
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+        elif ch.isalpha():
+            end = i
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[i:end]
+            out.append(_LITERALS.get(word, word))
+            i = end
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    if quote is not None:
+        out.append('"')
+    if stack:
+        # truncated reply: drop a dangling separator, then close the brackets
+        while out and (out[-1].isspace() or out[-1] in ",:"):
+            out.pop()
+        out.extend(_CLOSERS[o] for o in reversed(stack))
+    return "".join(out)
+
+
+def loads(text: str, opener: str | None = None) -> Any:
+    """Parse ``text`` as JSON, repairing common mistakes if needed."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair(text, opener))
+    except json.JSONDecodeError as exc:
+        error = exc
+    # a reply cut off inside a key or value keeps the items before it
+    cut = text.rfind(",")
+    if cut > 0:
+        try:
+            return json.loads(repair(text[:cut], opener))
+        except json.JSONDecodeError:
+            pass
+    raise StructuredOutputError(f"reply is not valid JSON: {error}") from error
+
+
+def extract(text: str, opener: str = "[") -> Any:
+    """Return the first JSON value starting with ``opener`` in ``text`` or ``None``."""
+    if opener not in text:
+        return None
+    try:
+        return loads(repair(text, opener))
+    except StructuredOutputError:
+        return None
+
+
+def _coerce(value: Any, kind: type) -> Any:
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ("true", "yes", "false", "no"):
+            return value.strip().lower() in ("true", "yes")
+        if value in (0, 1):
+            return bool(value)
+    elif kind in (int, float):
+        if isinstance(value, bool):
+            raise ValueError(value)
+        return kind(value)
+    elif kind is str:
+        if isinstance(value, (str, int, float)):
+            return str(value)
+    elif isinstance(value, kind):
+        return value
+    raise ValueError(value)
+
+
+def validate(value: Any, schema: Schema) -> Tuple[Dict[str, Any] | None, List[str]]:
+    """Check ``value`` against ``schema``.
+
+    Returns the value with its fields coerced to the schema types and the
+    names of the fields that are missing or invalid. Unknown fields are kept.
+    """
+    if not isinstance(value, dict):
+        return None, [name for name, (_, required) in schema.items() if required]
+    result = dict(value)
+    problems = []
+    for name, (kind, required) in schema.items():
+        if result.get(name) is None:
+            if required:
+                problems.append(name)
+            continue
+        try:
+            result[name] = _coerce(result[name], kind)
+        except (TypeError, ValueError):
+            problems.append(name)
+    return (None if problems else result), problems
+
+
+class JsonArrayStream:
+    """Incrementally parse the elements of a streamed JSON array.
+
+    :meth:`feed` takes the next chunk of the reply and returns the elements
+    completed by it that pass ``schema``; invalid elements are counted in
+    ``invalid``. :meth:`close` returns what can still be recovered once the
+    stream ended, e.g. from a truncated last element or an array wrapped in
+    an object.
+    """
+
+    def __init__(self, schema: Schema | None = None) -> None:
+        self.schema = schema
+        self.items: List[Any] = []
+        self.invalid = 0
+        self._text: List[str] = []
+        self._pos = 0
+        self._depth = 0
+        self._array: bool | None = None
+        # closing quote of the string being scanned, ``None`` outside strings
+        self._quote: str | None = None
+        self._escape = False
+        self._start: int | None = None
+
+    def _accept(self, fragment: str) -> List[Any]:
+        try:
+            value = loads(fragment)
+        except StructuredOutputError:
+            self.invalid += 1
+            return []
+        if self.schema is not None:
+            value, problems = validate(value, self.schema)
+            if problems:
+                self.invalid += 1
+                return []
+        self.items.append(value)
+        return [value]
+
+    def feed(self, chunk: str) -> List[Any]:
+        self._text.append(chunk)
+        completed: List[Any] = []
+        for ch in chunk:
+            pos = self._pos
+            self._pos += 1
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+                continue
+            if ch in "\"'“”" and self._depth > 0:
+                # both quote styles, as ``repair`` accepts; quotes in prose
+                # before the value (e.g. "Here's") open nothing
+                self._quote = "”" if ch in "“”" else ch
+                continue
+            if ch in "[{":
+                if self._array is None:
+                    # anything but a top-level array is left to ``close``
+                    self._array = ch == "["
+                self._depth += 1
+                if self._depth == 2 and self._array:
+                    self._start = pos
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._start is not None:
+                    text = "".join(self._text)
+                    completed.extend(self._accept(text[self._start:pos + 1]))
+                    self._start = None
+                elif self._depth == 0 and not self._array:
+                    # braces in prose before the array: keep looking for it
+                    self._array = None
+        return completed
+
+    def close(self) -> List[Any]:
+        text = "".join(self._text)
+        if self.items or self.invalid:
+            if self._start is None:
+                return []
+            # the reply was cut off inside the last element
+            return self._accept(text[self._start:])
+        try:
+            value = loads(text)
+        except StructuredOutputError:
+            value = None
+        if isinstance(value, dict) and any(isinstance(v, list) for v in value.values()):
+            value = next(v for v in value.values() if isinstance(v, list))
+        elif not isinstance(value, list):
+            # the first array anywhere in the reply, as before streaming
+            array = extract(text, "[")
+            if isinstance(array, list):
+                value = array
+            elif isinstance(value, dict):
+                value = [value]
+            else:
+                return []
+        recovered = []
+        for element in value:
+            recovered.extend(self._accept(json.dumps(element)))
+        return recovered
+
+
+def parse_array(text: str, schema: Schema | None = None) -> Tuple[List[Any], int]:
+    """Return the valid elements of the JSON array in ``text`` and the invalid count."""
+    stream = JsonArrayStream(schema)
+    stream.feed(text)
+    stream.close()
+    return stream.items, stream.invalid
+
+
+def parse_object(text: str, schema: Schema) -> Tuple[Dict[str, Any] | None, List[str]]:
+    """Parse and validate the JSON object in ``text``."""
+    try:
+        value = loads(text, "{")
+    except StructuredOutputError:
+        value = None
+    return validate(value, schema)
+
+
+def describe(schema: Schema) -> str:
+    """Return a short description of the fields in ``schema`` for prompts."""
+    return ", ".join(f'"{name}" ({_TYPE_NAMES.get(kind, kind.__name__)})' for name, (kind, _) in schema.items())
+
+
+def object_reask(schema: Schema, problems: Sequence[str]) -> str:
+    fields = ", ".join(f'"{name}"' for name in problems)
+    return f"Your reply was missing or had invalid fields: {fields}. Return only the JSON object with {describe(schema)}."
+
+
+def array_reask(schema: Schema, valid: int, requested: int) -> str:
+    missing = requested - valid
+    return (
+        f"Only {valid} of the {requested} requested items were valid. Return a JSON array with the "
+        f"{missing} missing items only, each an object with {describe(schema)}."
+    )
+
+
+def _followup(messages: List, reply: str, request: str) -> List:
+    return [*messages, AIMessage(content=reply), HumanMessage(content=request)]
+
+
+def complete_object(llm: Any, messages: List, reply: str, schema: Schema) -> Tuple[Dict[str, Any] | None, List[str]]:
+    """Parse ``reply`` and re-ask for invalid fields up to ``STRUCTURED_OUTPUT_MAX_REASKS`` times."""
+    result, problems = parse_object(reply, schema)
+    for _ in range(config.STRUCTURED_OUTPUT_MAX_REASKS):
+        if not problems:
+            break
+        reply = llm.invoke(_followup(messages, reply, object_reask(schema, problems))).content
+        result, problems = parse_object(reply, schema)
+    return result, problems
+
+
+async def acomplete_object(
+    llm: Any, messages: List, reply: str, schema: Schema
+) -> Tuple[Dict[str, Any] | None, List[str]]:
+    """Async variant of :func:`complete_object`."""
+    result, problems = parse_object(reply, schema)
+    for _ in range(config.STRUCTURED_OUTPUT_MAX_REASKS):
+        if not problems:
+            break
+        reply = (await llm.ainvoke(_followup(messages, reply, object_reask(schema, problems)))).content
+        result, problems = parse_object(reply, schema)
+    return result, problems
+
+
+def complete_array(llm: Any, messages: List, reply: str, items: List[Any], schema: Schema, count: int) -> List[Any]:
+    """Re-ask for the items of a ``count``-long array missing from ``items``.
+
+    Returns only the newly obtained items.
+    """
+    extra: List[Any] = []
+    for _ in range(config.STRUCTURED_OUTPUT_MAX_REASKS):
+        valid = len(items) + len(extra)
+        if valid >= count:
+            break
+        reply = llm.invoke(_followup(messages, reply, array_reask(schema, valid, count))).content
+        extra.extend(parse_array(reply, schema)[0][:count - valid])
+    return extra
+
+
+async def acomplete_array(
+    llm: Any, messages: List, reply: str, items: List[Any], schema: Schema, count: int
+) -> List[Any]:
+    """Async variant of :func:`complete_array`."""
+    extra: List[Any] = []
+    for _ in range(config.STRUCTURED_OUTPUT_MAX_REASKS):
+        valid = len(items) + len(extra)
+        if valid >= count:
+            break
+        reply = (await llm.ainvoke(_followup(messages, reply, array_reask(schema, valid, count)))).content
+        extra.extend(parse_array(reply, schema)[0][:count - valid])
+    return extra
@@ -0,0 +1,105 @@
+"""Offline stand-in for ``dspy.LM``.
+
+Kept apart from :mod:`stub_llm` so the stub chat backend does not import
+DSPy; this module is only imported once an improver is trained.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import dspy
+
+import config
+from stub_llm import _WORDS, _rng
+
+_FIELD_RE = re.compile(r"^\d+\. `(\w+)` \(([^)]*)\)", re.MULTILINE)
+
+
+def _output_fields(system: str) -> list[tuple[str, str]]:
+    start = system.find("Your output fields are:")
+    if start < 0:
+        return []
+    end = system.find("All interactions will be structured", start)
+    return _FIELD_RE.findall(system[start:end if end > 0 else None])
+
+
+def _field_value(name: str, type_name: str, rng: random.Random, reply_tokens: int) -> str:
+    literal = re.search(r"Literal\[['\"]([^'\"]+)['\"]", type_name)
+    if literal:
+        return literal.group(1)
+    if type_name.startswith("bool"):
+        return "True"
+    if type_name.startswith("int"):
+        return str(rng.randint(1, 5))
+    if type_name.startswith("float"):
+        return str(round(rng.random(), 2))
+    if type_name.startswith(("dict", "Dict")):
+        return "{}"
+    if type_name.startswith(("list", "List")):
+        return "[]"
+    words = " ".join(rng.choice(_WORDS) for _ in range(reply_tokens))
+    if name == "improved_prompt":
+        return f"You are a persuasive wizard. Convince the population agent to buy. {words}"
+    return words
+
+
+class StubLM(dspy.BaseLM):
+    """``dspy.BaseLM`` answering DSPy adapter prompts with stub values.
+
+    Output fields are read from the adapter's system message and filled
+    with seeded values of the declared type, so DSPy modules and
+    optimizers can run end to end offline.
+    """
+
+    def __init__(
+        self,
+        latency: float | None = None,
+        reply_tokens: int | None = None,
+        seed: int | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(model="stub", cache=False, **kwargs)
+        self.latency = config.STUB_LLM_LATENCY_SECONDS if latency is None else latency
+        self.reply_tokens = reply_tokens or config.STUB_LLM_REPLY_TOKENS
+        self.seed = config.STUB_LLM_SEED if seed is None else seed
+
+    def _response(self, prompt: str | None, messages: list | None) -> SimpleNamespace:
+        messages = messages or [{"role": "user", "content": prompt or ""}]
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        text = json.dumps(messages, default=str)
+        rng = _rng(self.seed, text)
+        fields = _output_fields(system) or [("output", "str")]
+        content = "\n\n".join(
+            f"[[ ## {name} ## ]]\n{_field_value(name, type_name, rng, self.reply_tokens)}"
+            for name, type_name in fields
+        ) + "\n\n[[ ## completed ## ]]"
+        prompt_tokens = len(text.split())
+        completion_tokens = len(content.split())
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(content=content, tool_calls=None),
+                    finish_reason="stop",
+                )
+            ],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            model="stub",
+        )
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        time.sleep(self.latency)
+        return self._response(prompt, messages)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._response(prompt, messages)
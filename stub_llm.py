@@ -0,0 +1,193 @@
+"""Offline stand-in for ``ChatOpenAI``; see :mod:`stub_dspy` for ``dspy.LM``.
+
+The stub models never touch the network. Replies are either scripted or
+drawn from a seeded random generator, and each call sleeps for a
+configurable latency, so the pipeline can be run and profiled without an
+API key.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+import config
+
+_WORDS = (
+    "price quality offer maybe think value today interesting really sure "
+    "budget need later compare features discount consider perhaps product"
+).split()
+_PERSONALITIES = ["cautious saver", "eager shopper", "skeptical engineer", "busy parent", "curious student"]
+
+
+def _messages_text(messages: Sequence[Any]) -> str:
+    return "\n".join(str(getattr(m, "content", m)) for m in messages)
+
+
+class _PrefixCache:
+    """Approximate provider prompt caching at message boundaries.
+
+    A prompt counts as cached up to the longest leading run of messages that
+    an earlier call in this process already sent.
+    """
+
+    def __init__(self) -> None:
+        self._seen: set = set()
+        self._limit = 100_000
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, messages: Sequence[Any]) -> int:
+        digest = hashlib.sha256()
+        cached = tokens = 0
+        prefixes = []
+        for message in messages:
+            content = str(getattr(message, "content", message))
+            digest.update(f"{getattr(message, 'type', '')}:{content}\0".encode("utf-8"))
+            tokens += len(content.split())
+            prefixes.append((digest.hexdigest(), tokens))
+        with self._lock:
+            for key, count in prefixes:
+                if key not in self._seen:
+                    break
+                cached = count
+            if len(self._seen) > self._limit:
+                self._seen.clear()
+            self._seen.update(key for key, _ in prefixes)
+        return cached
+
+
+_prefix_cache = _PrefixCache()
+
+
+def _rng(seed: int, text: str) -> random.Random:
+    # Seed from the prompt so replies do not depend on call order.
+    digest = hashlib.sha256(f"{seed}:{text}".encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def generate_reply(text: str, reply_tokens: int, seed: int, buy_probability: float) -> str:
+    """Return a plausible reply for the prompt ``text``.
+
+    Judge, persona and summary prompts get replies in the shape their callers
+    parse; every other prompt gets ``reply_tokens`` random words.
+    """
+    rng = _rng(seed, text)
+    lowered = text.lower()
+    if "numbered conversation" in lowered:
+        count = len(re.findall(r"^Conversation \d+", text, re.MULTILINE))
+        return json.dumps([
+            {"success": rng.random() < 0.5, "score": round(rng.random(), 2), "rationale": "stub"}
+            for _ in range(count)
+        ])
+    if "you are the judge" in lowered:
+        return json.dumps({"success": rng.random() < 0.5, "score": round(rng.random(), 2), "rationale": "stub"})
+    match = re.search(r"\bcreat(?:e|ing) (\d+) individuals", text, re.IGNORECASE)
+    if match:
+        return json.dumps([
+            {"name": f"Persona{rng.randrange(10**6)}", "personality": rng.choice(_PERSONALITIES)}
+            for _ in range(int(match.group(1)))
+        ])
+    words = [rng.choice(_WORDS) for _ in range(max(reply_tokens, 1))]
+    if rng.random() < buy_probability:
+        words[-1] = "buy"
+    return " ".join(words)
+
+
+class StubChatModel:
+    """Drop-in replacement for ``ChatOpenAI`` used by the agents.
+
+    ``script`` may be a list of replies returned in turn or a callable taking
+    the message list. Without a script replies come from
+    :func:`generate_reply`. Each call waits ``latency`` seconds plus
+    ``per_token_latency`` per generated token. The usage metadata reports
+    the prompt tokens a provider would have served from its prefix cache.
+    """
+
+    def __init__(
+        self,
+        llm_settings: dict | None = None,
+        script: Sequence[str] | Callable[[Sequence[Any]], str] | None = None,
+        latency: float | None = None,
+        per_token_latency: float | None = None,
+        reply_tokens: int | None = None,
+        seed: int | None = None,
+    ) -> None:
+        self.llm_settings = llm_settings or {}
+        self.script = script
+        self.latency = config.STUB_LLM_LATENCY_SECONDS if latency is None else latency
+        self.per_token_latency = (
+            config.STUB_LLM_PER_TOKEN_LATENCY_SECONDS if per_token_latency is None else per_token_latency
+        )
+        self.reply_tokens = reply_tokens or config.STUB_LLM_REPLY_TOKENS
+        self.seed = config.STUB_LLM_SEED if seed is None else seed
+        self._script_pos = 0
+        self.calls = 0
+
+    def _reply(self, messages: Sequence[Any]) -> str:
+        self.calls += 1
+        if callable(self.script):
+            return self.script(messages)
+        if self.script:
+            reply = self.script[self._script_pos % len(self.script)]
+            self._script_pos += 1
+            return reply
+        return generate_reply(
+            _messages_text(messages), self.reply_tokens, self.seed, config.STUB_LLM_BUY_PROBABILITY
+        )
+
+    def _message(self, messages: Sequence[Any], content: str) -> AIMessage:
+        input_tokens = len(_messages_text(messages).split())
+        output_tokens = len(content.split())
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {"cache_read": _prefix_cache.cached_tokens(messages)},
+            },
+        )
+
+    def _delay(self, content: str) -> float:
+        return self.latency + self.per_token_latency * len(content.split())
+
+    def invoke(self, messages: Sequence[Any], **kwargs: Any) -> AIMessage:
+        content = self._reply(messages)
+        time.sleep(self._delay(content))
+        return self._message(messages, content)
+
+    async def ainvoke(self, messages: Sequence[Any], **kwargs: Any) -> AIMessage:
+        content = self._reply(messages)
+        await asyncio.sleep(self._delay(content))
+        return self._message(messages, content)
+
+    def batch(self, inputs: List[Sequence[Any]], **kwargs: Any) -> List[AIMessage]:
+        contents = [self._reply(messages) for messages in inputs]
+        time.sleep(max((self._delay(c) for c in contents), default=0))
+        return [self._message(messages, c) for messages, c in zip(inputs, contents)]
+
+    async def abatch(self, inputs: List[Sequence[Any]], **kwargs: Any) -> List[AIMessage]:
+        contents = [self._reply(messages) for messages in inputs]
+        await asyncio.sleep(max((self._delay(c) for c in contents), default=0))
+        return [self._message(messages, c) for messages, c in zip(inputs, contents)]
+
+    def stream(self, messages: Sequence[Any], **kwargs: Any) -> Iterator[AIMessageChunk]:
+        words = self._reply(messages).split(" ")
+        time.sleep(self.latency)
+        for i, word in enumerate(words):
+            time.sleep(self.per_token_latency)
+            yield AIMessageChunk(content=word if i == 0 else " " + word)
+
+    async def astream(self, messages: Sequence[Any], **kwargs: Any):
+        words = self._reply(messages).split(" ")
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.per_token_latency)
+            yield AIMessageChunk(content=word if i == 0 else " " + word)
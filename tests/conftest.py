@@ -0,0 +1,37 @@
+"""Shared fixtures: every test runs offline on the stub backend in a temp dir."""
+from __future__ import annotations
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+
+@pytest.fixture
+def stub_env(tmp_path, monkeypatch):
+    """Run in an empty directory with the stub LLM backend and small runs."""
+    monkeypatch.chdir(tmp_path)
+    os.symlink(os.path.join(ROOT, "templates"), "templates")
+    monkeypatch.setattr(config, "LLM_BACKEND", "stub")
+    monkeypatch.setattr(config, "SHOW_LIVE_CONVERSATIONS", False)
+    monkeypatch.setattr(config, "POPULATION_SIZE", 6)
+    monkeypatch.setattr(config, "MAX_TURNS", 3)
+    monkeypatch.setattr(config, "SELF_IMPROVE_AFTER", [3])
+    return tmp_path
+
+
+def load_summary() -> list:
+    """Return the summary of the most recent run in ``config.LOGS_DIRECTORY``."""
+    runs = [
+        int(name[len("summary_"):-len(".json")])
+        for name in os.listdir(config.LOGS_DIRECTORY)
+        if name.startswith("summary_")
+    ]
+    with open(os.path.join(config.LOGS_DIRECTORY, f"summary_{max(runs)}.json"), encoding="utf-8") as fh:
+        return json.load(fh)
@@ -0,0 +1,13 @@
+import os
+
+from analytics import AnalyticsStore
+
+
+def test_interrupted_writes_are_not_listed(tmp_path):
+    store = AnalyticsStore(str(tmp_path))
+    store.ingest_summary(3, [{"pop_agent_id": "3.1", "score": 0.5, "success": True}])
+    # leftovers of interrupted writes, in the old and the current naming
+    for name in ("run_4.npz.tmp.npz", ".run_5.tmp.npz"):
+        open(os.path.join(tmp_path, name), "wb").close()
+    assert store.runs() == [3]
+    assert list(AnalyticsStore(str(tmp_path)).load()["score"]) == [0.5]
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import config
+from integrated_system import IntegratedSystem
+from population_agent import PopulationAgent
+from wizard_agent import WizardAgent
+
+
+def _index(agent_id: str) -> str:
+    # agent ids are "<run>.<index>_<timestamp>"
+    return agent_id.split("_")[0].split(".")[1]
+
+
+def test_concurrent_bookkeeping_matches_serial(stub_env, monkeypatch):
+    """Improvements see the same history at the same points, off the event loop."""
+    monkeypatch.setattr(config, "SELF_IMPROVE_AFTER", [2, 5])
+    seen = []
+    original_improve = WizardAgent.self_improve
+    original_respond = PopulationAgent.arespond_to
+
+    def _self_improve(wizard):
+        seen.append((
+            wizard.conversation_count,
+            [_index(log["pop_agent_id"]) for log in wizard.history_buffer],
+            threading.current_thread() is threading.main_thread(),
+        ))
+        original_improve(wizard)
+
+    async def _arespond_to(agent, *args, **kwargs):
+        # the first conversation finishes after the ones started with it
+        if _index(agent.agent_id) == "1":
+            await asyncio.sleep(0.05)
+        return await original_respond(agent, *args, **kwargs)
+
+    monkeypatch.setattr(WizardAgent, "self_improve", _self_improve)
+    monkeypatch.setattr(PopulationAgent, "arespond_to", _arespond_to)
+    runs = {}
+    for concurrency in (1, 4):
+        monkeypatch.setattr(config, "CONVERSATION_CONCURRENCY", concurrency)
+        seen.clear()
+        IntegratedSystem().run("Generate population", config.POPULATION_SIZE)
+        runs[concurrency] = list(seen)
+
+    expected = [(2, ["1", "2"]), (5, ["3", "4", "5"])]
+    assert [(count, history) for count, history, _ in runs[1]] == expected
+    assert [(count, history) for count, history, _ in runs[4]] == expected
+    assert not any(on_main for _, _, on_main in runs[4])
@@ -0,0 +1,23 @@
+import config
+import context_manager
+from conversation import ConversationState
+
+
+def test_system_prompt_is_tokenized_once(stub_env, monkeypatch):
+    monkeypatch.setattr(config, "CONTEXT_TOKEN_BUDGET", 10_000)
+    counted = []
+    original = context_manager.count_tokens
+
+    def _count_tokens(text):
+        counted.append(text)
+        return original(text)
+
+    monkeypatch.setattr(context_manager, "count_tokens", _count_tokens)
+    manager = context_manager.ContextManager()
+    state = ConversationState({"wizard": None, "pop": None})
+    prompt = "You are a persuasive wizard."
+    for turn in range(3):
+        manager.prepare(state, "wizard", prompt)
+        state.append("wizard", f"pitch {turn}")
+        state.append("pop", f"reply {turn}")
+    assert counted.count(prompt) == 1
@@ -0,0 +1,38 @@
+import json
+import re
+
+import config
+from god_agent import GodAgent
+from stub_llm import StubChatModel
+
+
+def _personas(messages):
+    request = messages[-1].content
+    numbered = re.findall(r"^(\d+)\. (.*)$", request, re.MULTILINE)
+    if numbered:
+        return [{"name": f"P{n}", "personality": text} for n, text in numbered]
+    count = int(re.search(r"Create (\d+) individuals", request).group(1))
+    return [{"name": f"P{n}", "personality": "shared"} for n in range(1, count + 1)]
+
+
+def test_bulk_spawn_keeps_one_instruction_per_spec(stub_env, monkeypatch):
+    monkeypatch.setattr(config, "GOD_SPAWN_CHUNK_SIZE", 3)
+    god = GodAgent()
+    god.llm = StubChatModel(script=lambda messages: json.dumps(_personas(messages)))
+    instructions = ["a pilot", "a baker", "a poet", "a judge", "a judge"]
+    population = god.spawn_population_bulk(instructions, run_no=1)
+    assert [agent.personality_description for agent in population] == [
+        "a pilot", "a baker", "a poet", "shared", "shared"
+    ]
+
+
+def test_bulk_spawn_warns_about_missing_personas(stub_env, monkeypatch, capsys):
+    monkeypatch.setattr(config, "GOD_SPAWN_CHUNK_SIZE", 3)
+    god = GodAgent()
+    # each chunk gets one persona too few and the re-ask yields nothing
+    god.llm = StubChatModel(
+        script=lambda messages: "[]" if len(messages) > 2 else json.dumps(_personas(messages)[:-1])
+    )
+    population = god.spawn_population_bulk(["x"] * 6, run_no=1)
+    assert [agent.agent_id.split("_")[0] for agent in population] == ["1.1", "1.2", "1.4", "1.5"]
+    assert "returned 4 of 6 personas; agents [3, 6] of run 1" in capsys.readouterr().out
@@ -0,0 +1,15 @@
+import config
+import instrumentation
+from conftest import load_summary
+from integrated_system import IntegratedSystem
+
+
+def test_concurrent_improvement_not_billed_to_a_conversation(stub_env, monkeypatch):
+    monkeypatch.setattr(config, "CONVERSATION_CONCURRENCY", 3)
+    IntegratedSystem().run("Generate population", config.POPULATION_SIZE)
+
+    assert instrumentation.get_instrumentation().by_role["optimizer"]["calls"] > 0
+    for entry in load_summary():
+        # one call per recorded turn plus the judge, including the
+        # conversation that triggered the improvement after it
+        assert entry["llm_calls"] == entry["turns"] + 1, entry["pop_agent_id"]
@@ -0,0 +1,34 @@
+import asyncio
+
+import config
+import llm_cache
+from stub_llm import StubChatModel
+
+
+def _model(tmp_path):
+    cache = llm_cache.LLMCache(str(tmp_path / "cache.sqlite"))
+    stub = StubChatModel()
+    return stub, llm_cache.CachedChatModel(stub, {"model": "stub", "temperature": 0}, cache)
+
+
+def test_batch_and_stream_use_the_cache(tmp_path):
+    stub, model = _model(tmp_path)
+    first = [("human", "one")]
+    reply = model.invoke(first).content
+
+    replies = model.batch([first, [("human", "two")]])
+    assert replies[0].content == reply and stub.calls == 2
+    assert asyncio.run(model.abatch([first, [("human", "two")]]))[1].content == replies[1].content
+    assert "".join(chunk.content for chunk in model.stream([("human", "two")])) == replies[1].content
+    assert stub.calls == 2
+
+    streamed = "".join(chunk.content for chunk in model.stream([("human", "three")]))
+    assert model.invoke([("human", "three")]).content == streamed
+    assert stub.calls == 3
+
+
+def test_cache_path_follows_logs_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "LOGS_DIRECTORY", str(tmp_path / "out"))
+    cache = llm_cache.LLMCache()
+    assert cache.path == str(tmp_path / "out" / config.LLM_CACHE_PATH)
+    cache.close()
@@ -0,0 +1,34 @@
+import errno
+
+import pytest
+
+import log_sink
+
+
+def test_writer_failure_is_raised_instead_of_hanging(tmp_path, monkeypatch):
+    def _full(path, compression):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(log_sink, "_open_segment", _full)
+    sink = log_sink.LogSink(str(tmp_path))
+    sink.write("a.json", {"n": 1})
+    with pytest.raises(OSError):
+        sink.flush()
+    with pytest.raises(OSError):
+        sink.write("b.json", {"n": 2})
+    with pytest.raises(OSError):
+        sink.close()
+
+
+def test_missing_zstandard_fails_at_construction(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_sink, "zstandard", None)
+    with pytest.raises(ValueError):
+        log_sink.LogSink(str(tmp_path), compression="zstd")
+
+
+def test_records_round_trip(tmp_path):
+    sink = log_sink.LogSink(str(tmp_path), max_records=2)
+    for n in range(5):
+        sink.write(f"{n}.json", {"n": n})
+    sink.close()
+    assert [record["n"] for _, record in log_sink.iter_segments(str(tmp_path))] == list(range(5))
@@ -0,0 +1,34 @@
+from structured_output import PERSONA_SCHEMA, JsonArrayStream, parse_array
+
+
+def test_single_quoted_strings_may_hold_brackets():
+    assert parse_array("['it]s', 'b']") == (["it]s", "b"], 0)
+    personas, invalid = parse_array(
+        "[{'name': 'Bo', 'personality': 'odd ]} one'}, {\"name\": \"Cy\", \"personality\": \"don't\"}]",
+        PERSONA_SCHEMA,
+    )
+    assert [p["personality"] for p in personas] == ["odd ]} one", "don't"]
+    assert invalid == 0
+
+
+def test_braces_in_prose_before_the_array():
+    reply = 'Each persona is {name, personality}. Here\'s the list: [{"name": "A", "personality": "x"}]'
+    stream = JsonArrayStream(PERSONA_SCHEMA)
+    # still streamed: the array starts after the prose braces close
+    assert stream.feed(reply) == [{"name": "A", "personality": "x"}]
+    assert stream.close() == []
+
+
+def test_close_falls_back_to_the_first_array():
+    reply = 'Personas {as requested:\n[{"name": "A", "personality": "x"}, {"name": "B", "personality": "y"}]'
+    personas, invalid = parse_array(reply, PERSONA_SCHEMA)
+    assert [p["name"] for p in personas] == ["A", "B"]
+    assert invalid == 0
+
+
+def test_wrapped_and_truncated_arrays():
+    assert parse_array('{"personas": [{"name": "A", "personality": "x"}]}', PERSONA_SCHEMA)[0] == [
+        {"name": "A", "personality": "x"}
+    ]
+    personas, invalid = parse_array('[{"name": "A", "personality": "x"}, {"name": "B", "pers', PERSONA_SCHEMA)
+    assert personas == [{"name": "A", "personality": "x"}] and invalid == 1
@@ -0,0 +1,36 @@
+import wizard_improver
+from transcript import ConversationLog, Turn
+from wizard_agent import WizardAgent
+
+
+def _log(wizard, agent_id, at):
+    turns = [Turn("wizard", "Would you like to buy it?", at), Turn("pop", "Maybe later.", at + 1)]
+    return ConversationLog(
+        wizard_id=wizard.wizard_id,
+        pop_agent_id=agent_id,
+        pop_agent_spec={},
+        goal=wizard.goal,
+        prompt_version=0,
+        turns=turns,
+        timestamp=at,
+        judge_result={"success": False, "score": 0.2},
+    )
+
+
+def test_examples_are_reused_across_improvement_rounds(stub_env, monkeypatch):
+    wizard = WizardAgent("Wizard_test")
+    datasets = []
+    original = wizard_improver.build_dataset
+
+    def _build_dataset(history):
+        datasets.append(original(history))
+        return datasets[-1]
+
+    monkeypatch.setattr(wizard_improver, "build_dataset", _build_dataset)
+    # the second round repeats the first conversation under another agent and time
+    for agent_id, at in (("1.1", 100.0), ("2.1", 200.0)):
+        wizard.history_buffer.append(_log(wizard, agent_id, at))
+        wizard.self_improve()
+        assert not wizard.history_buffer
+
+    assert datasets[1][0] is datasets[0][0]
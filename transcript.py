@@ -0,0 +1,147 @@
+"""Compact conversation transcripts, converted to JSON only when written.
+
+A conversation's turns are :class:`Turn` records with ``__slots__``, an
+interned speaker and an epoch-float timestamp. The same list of turns is
+shared by the population agent's :class:`conversation.ConversationState`
+and the wizard's :class:`ConversationLog`. Logs store the prompt version
+instead of the prompt text. The text is looked up in a registry of
+interned prompts.
+
+:meth:`ConversationLog.to_dict` returns the JSON layout used before: ISO
+timestamps, per-turn dicts and the full ``prompt`` and ``pop_agent_spec``.
+Turns and logs also support the read access of that layout
+(``turn["text"]``, ``log["prompt"]``), so readers of logs do not change.
+"""
+from __future__ import annotations
+
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+
+_prompts: Dict[Tuple[str, int], str] = {}
+
+
+def register_prompt(wizard_id: str, version: int, text: str) -> str:
+    """Record ``text`` as ``wizard_id``'s prompt ``version``; return the interned text."""
+    text = sys.intern(text)
+    _prompts[(wizard_id, version)] = text
+    return text
+
+
+def prompt_text(wizard_id: str, version: int) -> str:
+    return _prompts[(wizard_id, version)]
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def _epoch(value: Any) -> float:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+class Turn:
+    """One message of a conversation.
+
+    ``extra`` holds per-turn statistics (token usage, stream timings,
+    opener index) and is ``None`` for most turns.
+    """
+
+    __slots__ = ("speaker", "text", "time", "extra")
+
+    def __init__(self, speaker: str, text: str, at: float | None = None, extra: dict | None = None) -> None:
+        self.speaker = sys.intern(speaker)
+        self.text = text
+        self.time = time.time() if at is None else at
+        self.extra = extra or None
+
+    def update(self, *extras: dict | None) -> None:
+        for extra in extras:
+            if extra:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra.update(extra)
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "speaker":
+            return self.speaker
+        if key == "text":
+            return self.text
+        if key == "time":
+            return _iso(self.time)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("speaker", "text", "time") or (self.extra is not None and key in self.extra)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        turn = {"speaker": self.speaker, "text": self.text, "time": _iso(self.time)}
+        if self.extra:
+            turn.update(self.extra)
+        return turn
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Turn":
+        extra = {k: v for k, v in data.items() if k not in ("speaker", "text", "time")}
+        return cls(data["speaker"], data["text"], _epoch(data["time"]), extra)
+
+
+class ConversationLog(dict):
+    """Log of one conversation holding turns and a prompt version.
+
+    ``log["prompt"]`` is resolved from the prompt registry, and
+    ``timestamp`` is an epoch float until :meth:`to_dict`.
+    """
+
+    def __missing__(self, key: str) -> Any:
+        if key == "prompt":
+            return prompt_text(self["wizard_id"], self["prompt_version"])
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: object) -> bool:
+        return key == "prompt" or dict.__contains__(self, key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the log in its JSON layout."""
+        data: Dict[str, Any] = {
+            "wizard_id": self["wizard_id"],
+            "pop_agent_id": self["pop_agent_id"],
+            "pop_agent_spec": self["pop_agent_spec"],
+            "goal": self["goal"],
+            "prompt": self["prompt"],
+        }
+        for key, value in self.items():
+            if key == "turns":
+                value = [turn.to_dict() for turn in value]
+            elif key == "timestamp":
+                value = _iso(value)
+            data.setdefault(key, value)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationLog":
+        """Rebuild a compact log from :meth:`to_dict` output, e.g. a checkpoint."""
+        log = cls(data)
+        log.pop("prompt", None)
+        if "prompt" in data:
+            register_prompt(data["wizard_id"], data["prompt_version"], data["prompt"])
+        log["turns"] = [Turn.from_dict(turn) for turn in data.get("turns", [])]
+        log["timestamp"] = _epoch(data["timestamp"])
+        return log
@@ -1,20 +1,48 @@
 """Utility functions for timestamping and file I/O."""
+import asyncio
 import json
 import os
 from datetime import datetime, timezone
+from typing import Any, Awaitable, TypeVar
 
 import config
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+T = TypeVar("T")
+
+_loop: asyncio.AbstractEventLoop | None = None
+
 
 def get_timestamp() -> str:
     """Return the current UTC timestamp as an ISO 8601 string."""
     return datetime.now(timezone.utc).isoformat()
 
 
+def run_async(coro: Awaitable[T]) -> T:
+    """Run ``coro`` on the process-wide event loop.
+
+    Pooled async HTTP connections are bound to the loop that opened them, so
+    every async entry point shares one loop instead of calling ``asyncio.run``.
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
 def ensure_logs_dir():
     os.makedirs(config.LOGS_DIRECTORY, exist_ok=True)
 
 
+def logs_path(name: str) -> str:
+    """Return ``name`` under ``config.LOGS_DIRECTORY``; absolute paths are kept."""
+    return os.path.join(config.LOGS_DIRECTORY, name)
+
+
 def _run_counter_path() -> str:
     """Return the path of the run counter file."""
     ensure_logs_dir()
@@ -32,11 +60,27 @@ def get_run_number() -> int:
 
 
 def increment_run_number() -> int:
-    """Increment and persist the run counter, returning the new value."""
-    run_no = get_run_number() + 1
+    """Increment and persist the run counter, returning the new value.
+
+    The read-modify-write happens under an exclusive file lock so processes
+    started at the same time never receive the same run number.
+    """
     path = _run_counter_path()
-    with open(path, "w", encoding="utf-8") as fh:
-        fh.write(str(run_no))
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+", encoding="utf-8") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            text = fh.read().strip()
+            run_no = (int(text) if text else 0) + 1
+            fh.seek(0)
+            fh.truncate()
+            fh.write(str(run_no))
+            fh.flush()
+            os.fsync(fh.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
     return run_no
 
 
@@ -90,8 +134,17 @@ def append_improver_instruction_log(run_no: int, prompt: str) -> None:
 
 
 
-def save_conversation_log(log_obj: dict, filename: str) -> None:
-    """Save a conversation log as JSON under the logs directory."""
+def save_conversation_log(log_obj: dict, filename: str, buffered: bool = True) -> None:
+    """Save a conversation log as JSON under the logs directory.
+
+    When ``config.LOG_SINK_ENABLED`` is set and ``buffered`` is true the log is
+    queued on the background :class:`log_sink.LogSink` instead.
+    """
+    if buffered and config.LOG_SINK_ENABLED:
+        import log_sink
+
+        log_sink.get_sink().write(filename, log_obj)
+        return
     ensure_logs_dir()
     path = os.path.join(config.LOGS_DIRECTORY, filename)
     with open(path, "w", encoding="utf-8") as f:
@@ -100,26 +153,49 @@ def save_conversation_log(log_obj: dict, filename: str) -> None:
         json.dump(log_obj, f, indent=config.JSON_INDENT, default=str)
 
 
+def save_json_atomic(obj: Any, filename: str) -> None:
+    """Write ``obj`` as JSON under the logs directory via a temporary file.
+
+    The file is replaced in one step, so readers never see a partial write.
+    """
+    ensure_logs_dir()
+    path = os.path.join(config.LOGS_DIRECTORY, filename)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(obj, fh, default=str)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_json(filename: str) -> Any:
+    """Load a JSON file from the logs directory."""
+    with open(os.path.join(config.LOGS_DIRECTORY, filename), "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_text(text: str, filename: str) -> None:
+    """Write ``text`` to ``filename`` under the logs directory."""
+    ensure_logs_dir()
+    with open(os.path.join(config.LOGS_DIRECTORY, filename), "w", encoding="utf-8") as fh:
+        fh.write(text)
+
+
 def load_template(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+    """Return the text of the template at ``path``, read once per process."""
+    import prompts
+
+    return prompts.load(path).source
 
 
 def render_template(template_str: str, variables: dict) -> str:
-    text = template_str
-    for key, val in variables.items():
-        text = text.replace(f"{{{{{key}}}}}", str(val))
-    return text
+    import prompts
+
+    return prompts.compile_template(template_str).render(variables)
 
 
 def extract_json_array(text: str):
     """Return the first JSON array found in the provided text."""
-    import re
+    import structured_output
 
-    match = re.search(r"\[[^\[]*\]", text, re.DOTALL)
-    if not match:
-        return None
-    try:
-        return json.loads(match.group(0))
-    except Exception:
-        return None
+    return structured_output.extract(text, "[")
@@ -1,27 +1,25 @@
 """WizardAgent interacts with population agents and self-improves."""
 from __future__ import annotations
 
-from typing import Dict, List
-
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterable, List, Tuple
 
 
 import config
+import instrumentation
+import llm_clients
+import stop_detector
+import streaming
+import transcript
 import utils
-from judge_agent import JudgeAgent
-from wizard_improver import build_dataset, train_improver
-
-# Dspy is imported as placeholder - this code assumes Dspy provides a simple API
-# to fine tune prompts. Replace with actual implementation when available.
-try:
-    import dspy
-except ImportError:  # pragma: no cover - dspy not installed
-    dspy = None
-
-
-class ConversationLog(dict):
-    pass
+from context_manager import get_context_manager
+from judge_agent import JudgeAgent, JudgeQueue
+from opener_pool import OpenerPool
+from transcript import ConversationLog, Turn
 
 
 class WizardAgent:
@@ -33,104 +31,313 @@ class WizardAgent:
             "temperature": config.LLM_TEMPERATURE,
             "max_tokens": config.LLM_MAX_TOKENS,
         }
-        self.llm = ChatOpenAI(
-            model=self.llm_settings["model"],
-            temperature=self.llm_settings["temperature"],
-            max_tokens=self.llm_settings["max_tokens"],
-        )
+        self.llm = llm_clients.get_chat_model(self.llm_settings)
         self.system_prompt_template = utils.load_template(config.WIZARD_PROMPT_TEMPLATE_PATH)
-        self.current_prompt = utils.render_template(self.system_prompt_template, {"goal": self.goal})
+        self.current_prompt = transcript.register_prompt(
+            wizard_id, 0, utils.render_template(self.system_prompt_template, {"goal": self.goal})
+        )
+        # Incremented every time an improved prompt is swapped in
+        self.prompt_version = 0
+        self._prompt_lock = threading.Lock()
+        self._improver_pool: ThreadPoolExecutor | None = None
+        # (future, history, conversation count) of background improvements
+        self._improvements: List[Tuple[Future, List[ConversationLog], int]] = []
         self.conversation_count = 0
-        self.history_buffer: List[ConversationLog] = []
+        self.history_buffer: Deque[ConversationLog] = deque(maxlen=config.HISTORY_BUFFER_LIMIT)
         self.current_run_no = 0
+        self.context = get_context_manager()
+        self.stop_detector = stop_detector.get_stop_detector()
+        self.opener_pool = (
+            OpenerPool(self.llm, config.OPENER_POOL_SIZE, config.OPENER_POOL_SELECTION)
+            if config.OPENER_POOL_SIZE
+            else None
+        )
+        # One long-lived judge so every conversation reuses the same client
+        self.judge = JudgeAgent()
+        self.judge_queue = JudgeQueue(self.judge) if config.JUDGE_BACKGROUND else None
 
     def set_run(self, run_no: int) -> None:
         """Record the current run number for logging."""
         self.current_run_no = run_no
 
-    def converse_with(self, pop_agent, show_live: bool = False) -> ConversationLog:
+    def _new_log(self, pop_agent, state) -> ConversationLog:
+        # The prompt version is pinned for the whole conversation, even if an
+        # improvement finishes in the background meanwhile. The log shares
+        # the turns of the population agent's conversation state.
+        with self._prompt_lock:
+            version = self.prompt_version
+        return ConversationLog(
+            wizard_id=self.wizard_id,
+            pop_agent_id=pop_agent.agent_id,
+            pop_agent_spec=pop_agent.get_spec(),
+            goal=self.goal,
+            prompt_version=version,
+            turns=state.transcript,
+            timestamp=time.time(),
+        )
 
-        log = {
-            "wizard_id": self.wizard_id,
-            "pop_agent_id": pop_agent.agent_id,
-            "pop_agent_spec": pop_agent.get_spec(),
-            "goal": self.goal,
-            "prompt": self.current_prompt,
-            "turns": [],
-            "timestamp": utils.get_timestamp(),
-        }
-        for _ in range(config.MAX_TURNS):
-            messages = [SystemMessage(content=self.current_prompt)]
-            for t in log["turns"]:
-                if t["speaker"] == "wizard":
-                    messages.append(HumanMessage(content=t["text"]))
-                else:
-                    messages.append(AIMessage(content=t["text"]))
-
-            wizard_msg = self.llm.invoke(messages).content
-            log["turns"].append({"speaker": "wizard", "text": wizard_msg, "time": utils.get_timestamp()})
-            if show_live:
-                print(f"Wizard: {wizard_msg}")
-            pop_reply = pop_agent.respond_to(wizard_msg)
-            log["turns"].append({"speaker": "pop", "text": pop_reply, "time": utils.get_timestamp()})
-            if show_live:
-                print(f"{pop_agent.name}: {pop_reply}")
-
-            if self._check_goal(pop_reply):
-                break
-        judge = JudgeAgent()
-        result = judge.assess(log)
-        log["judge_result"] = result
+    def _record_turn(self, turn: Turn, label: str, show_live: bool, *extras: dict | None) -> None:
+        turn.update(*extras)
+        if show_live:
+            print(f"{label}: {turn.text}")
+
+    def _end_turns(self, log: ConversationLog, reason: str | None) -> None:
+        """Record why the conversation ended and how many turns that saved."""
+        log["stop_reason"] = reason or "max_turns"
+        log["turns_saved"] = config.MAX_TURNS - len(log["turns"]) // 2
+
+    def _summarize_streaming(self, log: ConversationLog, pop_agent) -> None:
+        if config.STREAM_RESPONSES:
+            max_tokens = pop_agent.llm_settings.get("max_tokens", config.LLM_MAX_TOKENS)
+            log["streaming"] = streaming.summarize(log["turns"], max_tokens)
+
+    def _record_finished(self, log: ConversationLog, result: Dict | None) -> bool:
+        """Record a finished conversation, returning whether to self-improve now.
+
+        ``result`` is ``None`` when judging runs in the background; the log is
+        then queued and its ``judge_result`` is filled in once assessed.
+        """
+        if result is None:
+            self.judge_queue.submit(log)
+        else:
+            log["judge_result"] = result
+        # the deque drops the oldest logs beyond ``HISTORY_BUFFER_LIMIT``
         self.history_buffer.append(log)
-        # ensure the history buffer does not grow without bound
-        if len(self.history_buffer) > config.HISTORY_BUFFER_LIMIT:
-            self.history_buffer = self.history_buffer[-config.HISTORY_BUFFER_LIMIT:]
         self.conversation_count += 1
-        if self._should_self_improve():
-            self.self_improve()
+        return self._should_self_improve()
+
+    def _improve_now(self) -> None:
+        if self.judge_queue is not None:
+            # self-improvement needs the scores of every buffered log
+            self.judge_queue.drain()
+        self.self_improve()
+
+    def finish_conversation(self, log: ConversationLog, result: Dict | None) -> None:
+        """Record a finished conversation and self-improve if one is due."""
+        if self._record_finished(log, result):
+            self._improve_now()
+
+    async def afinish_conversation(self, log: ConversationLog, result: Dict | None) -> None:
+        """Async variant of :meth:`finish_conversation`.
+
+        Self-improvement runs on a worker thread so the event loop keeps
+        serving the conversations still in flight.
+        """
+        if self._record_finished(log, result):
+            await asyncio.to_thread(self._improve_now)
+
+    def converse_with(self, pop_agent, show_live: bool = False) -> ConversationLog:
+        state = pop_agent.start_conversation()
+        log = self._new_log(pop_agent, state)
+        monitor = stop_detector.TurnMonitor(self.stop_detector)
+        reason = None
+        for turn_no in range(config.MAX_TURNS):
+            with instrumentation.scope("wizard", self.wizard_id, pop_agent.agent_id):
+                if self.context is None:
+                    messages, usage = state.messages_for("wizard", log["prompt"]), None
+                else:
+                    messages, usage = self.context.prepare(state, "wizard", log["prompt"])
+                if turn_no == 0 and self.opener_pool is not None:
+                    # the pool's sampling call is shared, so no conversation is billed for it
+                    with instrumentation.scope("wizard", self.wizard_id):
+                        wizard_msg, index = self.opener_pool.get(messages, log["prompt_version"])
+                    stream_stats = {"opener_index": index}
+                elif config.STREAM_RESPONSES:
+                    wizard_msg, stream_stats = streaming.stream_reply(self.llm, messages)
+                else:
+                    wizard_msg, stream_stats = self.llm.invoke(messages).content, None
+            pop_reply = pop_agent.respond_to(wizard_msg, stop_when=self._check_goal)
+            wizard_turn, pop_turn = state.transcript[-2:]
+            self._record_turn(wizard_turn, "Wizard", show_live, usage, stream_stats)
+            self._record_turn(pop_turn, pop_agent.name, show_live, pop_agent.last_usage, pop_agent.last_stream)
+
+            reason = monitor.observe(pop_reply)
+            if reason is not None:
+                break
+        state.close()
+        self._end_turns(log, reason)
+        self._summarize_streaming(log, pop_agent)
+        result = None if self.judge_queue is not None else self.judge.assess(log)
+        self.finish_conversation(log, result)
+        return log
+
+    async def aconverse_with(self, pop_agent, show_live: bool = False) -> ConversationLog:
+        """Async variant of :meth:`converse_with` using the LLMs' ``ainvoke``."""
+        log, result = await self.arun_conversation(pop_agent, show_live)
+        await self.afinish_conversation(log, result)
         return log
 
+    async def arun_conversation(
+        self, pop_agent, show_live: bool = False
+    ) -> Tuple[ConversationLog, Dict | None]:
+        """Hold a conversation without recording it.
+
+        Returns the log and the judge result (``None`` with background
+        judging). Concurrent callers pass both to :meth:`afinish_conversation`
+        in the order the conversations started, so the history buffer, the
+        conversation count and the self-improvement points match serial runs.
+        """
+        state = pop_agent.start_conversation()
+        log = self._new_log(pop_agent, state)
+        monitor = stop_detector.TurnMonitor(self.stop_detector)
+        reason = None
+        for turn_no in range(config.MAX_TURNS):
+            with instrumentation.scope("wizard", self.wizard_id, pop_agent.agent_id):
+                if self.context is None:
+                    messages, usage = state.messages_for("wizard", log["prompt"]), None
+                else:
+                    messages, usage = await self.context.aprepare(state, "wizard", log["prompt"])
+                if turn_no == 0 and self.opener_pool is not None:
+                    with instrumentation.scope("wizard", self.wizard_id):
+                        wizard_msg, index = await self.opener_pool.aget(messages, log["prompt_version"])
+                    stream_stats = {"opener_index": index}
+                elif config.STREAM_RESPONSES:
+                    wizard_msg, stream_stats = await streaming.astream_reply(self.llm, messages)
+                else:
+                    wizard_msg, stream_stats = (await self.llm.ainvoke(messages)).content, None
+            pop_reply = await pop_agent.arespond_to(wizard_msg, stop_when=self._check_goal)
+            wizard_turn, pop_turn = state.transcript[-2:]
+            self._record_turn(wizard_turn, "Wizard", show_live, usage, stream_stats)
+            self._record_turn(pop_turn, pop_agent.name, show_live, pop_agent.last_usage, pop_agent.last_stream)
+
+            reason = monitor.observe(pop_reply)
+            if reason is not None:
+                break
+        state.close()
+        self._end_turns(log, reason)
+        self._summarize_streaming(log, pop_agent)
+        result = None if self.judge_queue is not None else await self.judge.aassess(log)
+        return log, result
+
     def _check_goal(self, text: str) -> bool:
-        return "buy" in text.lower()
+        return self.stop_detector.accepts(text)
 
-    def _should_self_improve(self) -> bool:
+    def _should_self_improve(self, count: int | None = None) -> bool:
         """Determine whether to run the improver based on the schedule."""
+        count = self.conversation_count if count is None else count
         schedule = config.SELF_IMPROVE_AFTER
         if isinstance(schedule, int):
-            return schedule > 0 and self.conversation_count % schedule == 0
+            return schedule > 0 and count % schedule == 0
         if isinstance(schedule, str):
             schedule = [s for s in schedule.split(";") if s.strip()]
         try:
             points = {int(x) for x in schedule}
         except TypeError:
             return False
-        return self.conversation_count in points
+        return count in points
+
+    def improvement_points(self, n: int) -> List[int]:
+        """Return the conversation counts up to ``n`` that trigger an improvement."""
+        return [count for count in range(1, n + 1) if self._should_self_improve(count)]
 
     def self_improve(self) -> None:
-        """Train an improver on the conversation history."""
-        if dspy is None:
+        """Train an improver on the conversation history.
+
+        With ``config.SELF_IMPROVE_BACKGROUND`` the buffered logs are handed
+        to a worker thread and conversations continue on the current prompt
+        until the improved one is swapped in.
+        """
+        # DSPy is slow to import, so it is only loaded once an improvement runs
+        import wizard_improver
+
+        if wizard_improver.dspy is None:
             return
 
-        dataset = build_dataset(self.history_buffer)
-        improver, metrics = train_improver(dataset)
+        history = list(self.history_buffer)
+        self.history_buffer.clear()
+        if config.SELF_IMPROVE_BACKGROUND:
+            if self._improver_pool is None:
+                self._improver_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wizard-improver")
+            future = self._improver_pool.submit(self._improve_from, history, self.conversation_count)
+            self._improvements.append((future, history, self.conversation_count))
+            return
+        self._improve_from(history, self.conversation_count)
+
+    def wait_for_improvements(self) -> None:
+        """Block until background improvements finish, re-raising failures."""
+        improvements, self._improvements = self._improvements, []
+        for future, _, _ in improvements:
+            future.result()
+
+    def checkpoint_state(self, completed: Iterable[str]) -> Dict[str, Any]:
+        """Return the prompt and self-improvement state for a checkpoint.
+
+        Only logs of conversations in ``completed`` are included, so
+        conversations still running are simply repeated after a resume.
+        Histories handed to unfinished background improvements are saved so
+        the improvement is retried on resume.
+        """
+        completed = set(completed)
+        with self._prompt_lock:
+            prompt, version = self.current_prompt, self.prompt_version
+        return {
+            "current_prompt": prompt,
+            "prompt_version": version,
+            "conversation_count": len(completed),
+            "history_buffer": [
+                log.to_dict() for log in self.history_buffer if log["pop_agent_id"] in completed
+            ],
+            "pending_improvements": [
+                {"history": [log.to_dict() for log in history], "conv_no": conv_no}
+                for future, history, conv_no in self._improvements
+                if not future.done()
+            ],
+        }
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        """Restore the state saved by :meth:`checkpoint_state`."""
+        with self._prompt_lock:
+            self.prompt_version = state["prompt_version"]
+            self.current_prompt = transcript.register_prompt(
+                self.wizard_id, self.prompt_version, state["current_prompt"]
+            )
+        self.conversation_count = state["conversation_count"]
+        self.history_buffer.clear()
+        self.history_buffer.extend(ConversationLog.from_dict(log) for log in state["history_buffer"])
+        for pending in state.get("pending_improvements", []):
+            history = [ConversationLog.from_dict(log) for log in pending["history"]]
+            if config.SELF_IMPROVE_BACKGROUND:
+                if self._improver_pool is None:
+                    self._improver_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wizard-improver")
+                future = self._improver_pool.submit(self._improve_from, history, pending["conv_no"])
+                self._improvements.append((future, history, pending["conv_no"]))
+            else:
+                self._improve_from(history, pending["conv_no"])
+
+    def _improve_from(self, history: List[ConversationLog], conv_no: int) -> None:
+        from wizard_improver import build_dataset, train_improver
+
+        with self._prompt_lock:
+            base_prompt = self.current_prompt
 
-        logs_example = dataset[-1].logs if dataset else ""
-        result = improver(instruction=self.current_prompt, logs=logs_example, goal=self.goal)
-        self.current_prompt = getattr(result, "improved_prompt", self.current_prompt)
+        # a run-level scope, so an improvement triggered from inside a
+        # conversation's scope is not billed to that conversation
+        with instrumentation.scope("optimizer", "dspy"):
+            dataset = build_dataset(history)
+            improver, metrics = train_improver(dataset)
+
+            logs_example = dataset[-1].logs if dataset else ""
+            result = improver(instruction=base_prompt, logs=logs_example, goal=self.goal)
+        new_prompt = getattr(result, "improved_prompt", base_prompt)
+        with self._prompt_lock:
+            self.prompt_version += 1
+            version = self.prompt_version
+            self.current_prompt = transcript.register_prompt(self.wizard_id, version, new_prompt)
+        if self.opener_pool is not None:
+            # openers of the old prompt must not open conversations on the new one
+            self.opener_pool.invalidate()
         improver_instructions = metrics.get("best_prompt") or improver.agent.signature.instructions
         utils.append_improver_instruction_log(self.current_run_no, improver_instructions)
 
         log_path = f"improve_{utils.get_timestamp().replace(':', '').replace('-', '')}.json"
         utils.save_conversation_log(
-            {"prompt": self.current_prompt, "metrics": metrics}, log_path
+            {"prompt": new_prompt, "prompt_version": version, "metrics": metrics}, log_path
         )
         print(f"Wizard improved prompt saved to {log_path}")
         utils.append_improvement_log(
             self.current_run_no,
-            self.current_prompt,
+            new_prompt,
             metrics.get("method"),
-            conv_no=self.conversation_count,
+            conv_no=conv_no,
             dataset_size=len(dataset),
         )
-
-        self.history_buffer.clear()
@@ -1,15 +1,23 @@
 """Module for improving wizard prompts using DSPy optimizers."""
 from __future__ import annotations
 
-from typing import List
+from collections import OrderedDict
+from typing import Any, Dict, List
+import hashlib
+import json
+import os
 import re
+import threading
+import time
 
 import config
+import instrumentation
 import utils
 
 try:
     import dspy
     from dspy.teleprompt.mipro_optimizer_v2 import MIPROv2 as OptimizePrompts
+    from dspy.utils.callback import BaseCallback
 except Exception:  # pragma: no cover - DSPy optional
     dspy = None
 
@@ -33,9 +41,100 @@ if dspy is not None:
             self.agent = dspy.ReAct(ImproveSignature, tools=[])
 
         def forward(self, instruction: str, logs: str, goal: str) -> dspy.Prediction:
+            budget = dspy.settings.get("improver_budget")
+            if budget is not None:
+                budget.check()
             return self.agent(instruction=instruction, logs=logs, goal=goal)
 
 
+    class BudgetExceeded(RuntimeError):
+        """Raised when an optimization step runs out of LM calls or time."""
+
+
+    class OptimizerBudget(BaseCallback):
+        """Count optimizer LM calls and remember the best evaluated program.
+
+        ``max_calls`` and ``max_seconds`` may be ``None`` for no limit. Every
+        LM call made through :meth:`guard` goes through :meth:`acquire`, so
+        proposer and instruction-generation calls count as well. Once either
+        limit is reached :class:`BudgetExceeded` is raised. Evaluations
+        finished before that point are scored, so the best one can still be
+        returned.
+        """
+
+        def __init__(self, max_calls: int | None = None, max_seconds: float | None = None) -> None:
+            self.max_calls = max_calls
+            self.max_seconds = max_seconds
+            self.calls = 0
+            self.exhausted = False
+            self.best_score: float | None = None
+            self.best_program: dspy.Module | None = None
+            self._started = time.perf_counter()
+            self._programs: Dict[str, dspy.Module] = {}
+            self._lock = threading.Lock()
+
+        def elapsed(self) -> float:
+            return time.perf_counter() - self._started
+
+        def _check(self) -> None:
+            if not self.exhausted:
+                over_calls = self.max_calls is not None and self.calls >= self.max_calls
+                over_time = self.max_seconds is not None and self.elapsed() >= self.max_seconds
+                self.exhausted = over_calls or over_time
+            if self.exhausted:
+                raise BudgetExceeded(f"optimizer budget exhausted after {self.calls} LM calls")
+
+        def check(self) -> None:
+            with self._lock:
+                self._check()
+
+        def acquire(self) -> None:
+            """Count one LM call, raising :class:`BudgetExceeded` if none is left."""
+            with self._lock:
+                self._check()
+                self.calls += 1
+
+        def guard(self, lm: dspy.BaseLM) -> dspy.BaseLM:
+            """Return a copy of ``lm`` whose calls are charged to this budget.
+
+            DSPy ignores exceptions raised by callbacks, so the limit is
+            enforced by the LM itself.
+            """
+            guarded = lm.copy()
+            guarded.__class__ = type(f"Budgeted{type(lm).__name__}", (_BudgetedLM, type(lm)), {})
+            guarded.improver_budget = self
+            return guarded
+
+        def on_evaluate_start(self, call_id, instance, inputs):
+            self._programs[call_id] = inputs.get("program")
+
+        def on_evaluate_end(self, call_id, outputs, exception=None):
+            program = self._programs.pop(call_id, None)
+            score = getattr(outputs, "score", outputs)
+            # evaluations cut short by the budget have failed examples
+            if exception is not None or self.exhausted or program is None or not isinstance(score, (int, float)):
+                return
+            with self._lock:
+                if self.best_score is None or score > self.best_score:
+                    self.best_score = score
+                    # optimizers keep mutating the evaluated module
+                    self.best_program = program.deepcopy()
+
+
+    class _BudgetedLM:
+        """Mixin acquiring the optimizer budget before every LM call."""
+
+        improver_budget: OptimizerBudget
+
+        def __call__(self, *args, **kwargs):
+            self.improver_budget.acquire()
+            return super().__call__(*args, **kwargs)
+
+        async def acall(self, *args, **kwargs):
+            self.improver_budget.acquire()
+            return await super().acall(*args, **kwargs)
+
+
     def _extract_instructions(program: object) -> str:
         """Return the instructions string from a candidate program.
 
@@ -78,10 +177,40 @@ if dspy is not None:
         return text.strip()
 
 
+    # Examples already built, keyed by conversation content, most recently used last
+    _examples: "OrderedDict[str, dspy.Example]" = OrderedDict()
+    _EXAMPLE_CACHE_LIMIT = 1000
+
+
+    def _example_key(log: dict) -> str:
+        # content only: the history buffer is cleared after every improvement,
+        # so a key naming the agent or time could never be seen again
+        payload = [
+            log.get("prompt"),
+            log.get("goal"),
+            [[t["speaker"], t["text"]] for t in log.get("turns", [])],
+            log.get("judge_result"),
+        ]
+        blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()
+
+
     def build_dataset(history: List[dict]) -> List[dspy.Example]:
-        """Convert conversation history into a DSPy dataset."""
+        """Convert conversation history into a DSPy dataset.
+
+        Examples are memoized by conversation content, so a conversation
+        repeated in a later improvement step (the same prompt, turns and
+        judge result, as in replayed or deterministic runs) reuses the
+        example built earlier.
+        """
         dataset = []
         for log in history:
+            key = _example_key(log)
+            ex = _examples.get(key)
+            if ex is not None:
+                _examples.move_to_end(key)
+                dataset.append(ex)
+                continue
             transcript = "\n".join(f"{t['speaker']}: {t['text']}" for t in log.get('turns', []))
             judge = log.get("judge_result", {})
             score = judge.get("score", 0)
@@ -94,46 +223,87 @@ if dspy is not None:
                 )
                 .with_inputs("instruction", "logs", "goal")
             )
+            _examples[key] = ex
+            if len(_examples) > _EXAMPLE_CACHE_LIMIT:
+                _examples.popitem(last=False)
             dataset.append(ex)
         return dataset
 
 
-    def train_improver(dataset: List[dspy.Example]) -> tuple[WizardImprover, dict]:
-        """Train a WizardImprover on the dataset."""
+    def _select_method(dataset_size: int) -> str:
+        if dataset_size >= config.DSPY_MIPRO_MINIBATCH_SIZE:
+            return "MIPROv2"
+        if dataset_size >= config.DSPY_BOOTSRAP_MINIBATCH_SIZE:
+            return "BootstrapFewShot"
+        return "COPRO"
 
-        if dspy.settings.lm is None:
-            dspy.settings.configure(
-                lm=dspy.LM(
-                    model=config.LLM_MODEL,
-                    temperature=config.LLM_TEMPERATURE,
-                    max_tokens=config.LLM_MAX_TOKENS,
-                )
-            )
 
-        def metric(
-            example: dspy.Example, pred: dspy.Prediction, trace: object | None = None
-        ) -> float:
-            """Score an improved prompt.
+    def _file_digest(path: str) -> str | None:
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
 
-            ``BootstrapFewShot`` and other teleprompters call ``metric`` with
-            ``example``, ``prediction`` and a ``trace`` object. The ``trace`` is
-            optional for this implementation so we default it to ``None`` in
-            order to remain compatible with optimizers that supply it.
-            """
 
-            base = example.score or 0
-            bonus = 1.0 if "buy" in pred.improved_prompt.lower() else 0.0
-            return base + bonus
+    def _program_key(dataset: List[dspy.Example], method: str) -> str:
+        """Hash the dataset together with every setting that affects training."""
+        payload = {
+            "examples": [[ex.instruction, ex.logs, ex.goal, ex.score] for ex in dataset],
+            "method": method,
+            "training_iter": config.DSPY_TRAINING_ITER,
+            "mipro_minibatch": config.DSPY_MIPRO_MINIBATCH_SIZE,
+            "bootstrap_minibatch": config.DSPY_BOOTSRAP_MINIBATCH_SIZE,
+            "backend": config.LLM_BACKEND,
+            "model": config.LLM_MODEL,
+            "temperature": config.LLM_TEMPERATURE,
+            "max_tokens": config.LLM_MAX_TOKENS,
+            "warm_start": _file_digest(_program_path("latest")) if config.IMPROVER_WARM_START else None,
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()
 
-        improver_module = WizardImprover()
-        if len(dataset) >= config.DSPY_MIPRO_MINIBATCH_SIZE:
+
+    def _program_path(name: str) -> str:
+        return os.path.join(utils.logs_path(config.IMPROVER_CACHE_DIRECTORY), f"{name}.json")
+
+
+    def _save_program(name: str, program: dspy.Module, metrics: Dict[str, Any]) -> None:
+        os.makedirs(utils.logs_path(config.IMPROVER_CACHE_DIRECTORY), exist_ok=True)
+        path = _program_path(name)
+        program.save(path + ".tmp.json")
+        os.replace(path + ".tmp.json", path)
+        stored = {k: metrics[k] for k in ("best_score", "best_prompt", "method")}
+        with open(_program_path(f"{name}.metrics"), "w", encoding="utf-8") as fh:
+            json.dump(stored, fh, default=str)
+
+
+    def _load_program(name: str) -> tuple[WizardImprover, dict] | None:
+        path = _program_path(name)
+        if not os.path.exists(path):
+            return None
+        program = WizardImprover()
+        program.load(path)
+        metrics: Dict[str, Any] = {}
+        if os.path.exists(_program_path(f"{name}.metrics")):
+            with open(_program_path(f"{name}.metrics"), "r", encoding="utf-8") as fh:
+                metrics = json.load(fh)
+        return program, metrics
+
+
+    def _compile(method: str, module: WizardImprover, dataset: List[dspy.Example], metric) -> dspy.Module:
+        """Run the ``method`` optimizer on ``module``.
+
+        MIPROv2 and COPRO evaluate candidates on ``config.DSPY_NUM_THREADS``
+        threads. BootstrapFewShot has no evaluation phase to parallelise.
+        """
+        if method == "MIPROv2":
             optimizer = OptimizePrompts(
                 metric=metric,
                 num_candidates=4,
                 auto=None,
+                num_threads=config.DSPY_NUM_THREADS,
                 verbose=False,
             )
-            method = "MIPROv2"
             # DSPy derives the validation set as 80% of the trainset. When the
             # dataset is small this can make the validation size smaller than
             # ``DSPY_MIPRO_MINIBATCH_SIZE`` which causes ``compile`` to raise a
@@ -142,29 +312,92 @@ if dspy is not None:
             valset_size = int(len(dataset) * 0.8)
             minibatch = min(config.DSPY_MIPRO_MINIBATCH_SIZE, valset_size)
 
-            method = "MIPROv2"
-            trained = optimizer.compile(
-                improver_module,
+            return optimizer.compile(
+                module,
                 trainset=dataset,
                 num_trials=config.DSPY_TRAINING_ITER,
                 provide_traceback=True,
                 minibatch_size=minibatch,
             )
-        elif len(dataset) >= config.DSPY_BOOTSRAP_MINIBATCH_SIZE:
+        if method == "BootstrapFewShot":
             optimizer = dspy.teleprompt.BootstrapFewShot(metric=metric)
-            method = "BootstrapFewShot"
-            trained = optimizer.compile(
-                improver_module,
+            return optimizer.compile(
+                module,
                 trainset=dataset,
             )
-        else:
-            optimizer = dspy.COPRO(metric=metric)
-            method = "COPRO"
-            trained = optimizer.compile(
-                improver_module,
-                trainset=dataset,
-                eval_kwargs={"display_progress": False},
-            )
+        optimizer = dspy.COPRO(metric=metric)
+        return optimizer.compile(
+            module,
+            trainset=dataset,
+            eval_kwargs={"display_progress": False, "num_threads": config.DSPY_NUM_THREADS},
+        )
+
+
+    def train_improver(dataset: List[dspy.Example]) -> tuple[WizardImprover, dict]:
+        """Train a WizardImprover on the dataset."""
+
+        if dspy.settings.lm is None:
+            # DSPy calls bypass the pooled chat models, so record them via a callback
+            callbacks = [instrumentation.dspy_callback()] if config.INSTRUMENTATION_ENABLED else []
+            if config.LLM_BACKEND == "stub":
+                from stub_dspy import StubLM
+
+                lm = StubLM(callbacks=callbacks)
+            else:
+                lm = dspy.LM(
+                    model=config.LLM_MODEL,
+                    temperature=config.LLM_TEMPERATURE,
+                    max_tokens=config.LLM_MAX_TOKENS,
+                    callbacks=callbacks,
+                )
+            dspy.settings.configure(lm=lm)
+
+        def metric(
+            example: dspy.Example, pred: dspy.Prediction, trace: object | None = None
+        ) -> float:
+            """Score an improved prompt.
+
+            ``BootstrapFewShot`` and other teleprompters call ``metric`` with
+            ``example``, ``prediction`` and a ``trace`` object. The ``trace`` is
+            optional for this implementation so we default it to ``None`` in
+            order to remain compatible with optimizers that supply it.
+            """
+
+            base = example.score or 0
+            bonus = 1.0 if "buy" in pred.improved_prompt.lower() else 0.0
+            return base + bonus
+
+        method = _select_method(len(dataset))
+        key = _program_key(dataset, method) if config.IMPROVER_CACHE_ENABLED else None
+        if key is not None:
+            cached = _load_program(key)
+            if cached is not None:
+                program, metrics = cached
+                metrics.update(iterations=[], cache_hit=True)
+                return program, metrics
+
+        improver_module = WizardImprover()
+        if config.IMPROVER_WARM_START:
+            # start from the instructions and demos of the last trained program
+            latest = _load_program("latest")
+            if latest is not None:
+                improver_module = latest[0]
+
+        budget = OptimizerBudget(config.DSPY_MAX_LM_CALLS, config.DSPY_MAX_SECONDS)
+        try:
+            # the budget is read by ``WizardImprover.forward`` in every
+            # evaluation thread, so it travels with the DSPy settings
+            with dspy.context(
+                lm=budget.guard(dspy.settings.lm),
+                callbacks=[*dspy.settings.get("callbacks", []), budget],
+                improver_budget=budget,
+            ):
+                trained = _compile(method, improver_module, dataset, metric)
+        except Exception:
+            if not budget.exhausted:
+                raise
+            # fall back to the best candidate evaluated before the budget ran out
+            trained = budget.best_program or improver_module
 
         candidates = getattr(trained, "candidate_programs", [])
         if candidates:
@@ -173,13 +406,23 @@ if dspy is not None:
             best_score = best.get("score", 0)
         else:
             best_prompt = _extract_instructions(trained)
-            best_score = 0
+            best_score = budget.best_score if budget.exhausted and budget.best_score is not None else 0
         metrics = {
             "best_score": best_score,
             "iterations": candidates,
             "best_prompt": best_prompt,
             "method": method,
+            "lm_calls": budget.calls,
+            "seconds": round(budget.elapsed(), 3),
+            "budget_exhausted": budget.exhausted,
         }
+        if budget.exhausted:
+            # a program cut short by the budget must not be reused once the limits change
+            return trained, metrics
+        if key is not None:
+            _save_program(key, trained, metrics)
+        if config.IMPROVER_WARM_START:
+            _save_program("latest", trained, metrics)
         return trained, metrics
 
 else:  # DSPy not available